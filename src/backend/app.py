@@ -1,53 +1,162 @@
+import hashlib
+import queue
 import sqlite3
+import threading
+import time
 from flask import Flask, request, jsonify, g
-from functools import wraps
 from datetime import date
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app) # CORS 설정 추가
 
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            try:
-                token = request.headers['Authorization'].split(" ")[1]
-            except IndexError:
-                pass
-        if not token:
-            return jsonify({"status": "error", "message": "Token is missing!"}), 401
+DATABASE = 'database.sqlite'
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256
+WAL_AUTOCHECKPOINT = 10_000  # pages; 이벤트가 몰릴 때 체크포인트 빈도 감소
+MMAP_SIZE = 256 * 1024 * 1024  # bytes; 읽기 전용 페이지를 mmap 창으로
+
+# 요청마다 같은 문자열을 쓰도록 SQL은 모듈 상수로 한 번만 정의
+# (풀의 연결이 재사용되므로 연결별 statement cache 에서 파싱 결과가 재사용됨)
+SQL_SELECT_USER = "SELECT user_id FROM users WHERE api_token = ? LIMIT 1"
+SQL_INSERT_EVENT = (
+    "INSERT INTO events_raw (user_id, url, title, start_time, end_time, duration_seconds, tab_id, window_id) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# 요청마다 connect/close 하지 않도록 연결을 재사용하는 풀
+_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=POOL_SIZE)
+
+def _open_conn():
+    # isolation_level=None: 암묵적 BEGIN 없이 autocommit, 쓰기 트랜잭션은 핸들러에서 명시적으로 시작
+    conn = sqlite3.connect(DATABASE, check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    # 연결 단위 PRAGMA (DB 파일에 저장되지 않으므로 연결마다 지정)
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL 에서는 커밋마다 fsync 하지 않음
+    conn.execute("PRAGMA temp_store=MEMORY")  # 임시 테이블/정렬을 메모리에서
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")  # 읽기를 mmap 으로
+    conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT}")
+    return conn
+
+def _get_pooled_conn():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return _open_conn()
+
+def _release_conn(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+@app.before_request
+def _attach_db():
+    g.db = _get_pooled_conn()
+
+@app.teardown_request
+def _detach_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        _release_conn(conn)
+
+TOKEN_CACHE_SIZE = 10_000
+TOKEN_CACHE_TTL = 300  # seconds
+
+class _TokenCache:
+    """토큰 → user_id TTL 캐시 (키는 원본 토큰 대신 blake2b 해시)."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, token, value):
+        key = self._key(token)
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.maxsize:
+                # 가장 오래 전에 넣은 항목부터 제거 (dict 는 삽입 순서 유지)
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._data.pop(self._key(token), None)
+
+_token_cache = _TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def requires_auth(f):
+    """인증이 필요한 엔드포인트 표시. 실제 토큰 검사는 _authenticate 훅에서 요청당 한 번 수행하고 g.current_user_id 설정."""
+    f.requires_auth = True
+    return f
+
+@app.before_request
+def _authenticate():
+    view = app.view_functions.get(request.endpoint)
+    # CORS preflight(OPTIONS)는 토큰 없이 통과
+    if request.method == 'OPTIONS' or not getattr(view, 'requires_auth', False):
+        return None
+    token = None
+    if 'Authorization' in request.headers:
         try:
-            with sqlite3.connect('database.sqlite') as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM users WHERE api_token = ?", (token,))
-                user = cursor.fetchone()
-                if not user:
-                    return jsonify({"status": "error", "message": "Token is invalid!"}), 401
-                g.current_user = dict(user)
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)}), 500
-        return f(*args, **kwargs)
-    return decorated
+            token = request.headers['Authorization'].split(" ")[1]
+        except IndexError:
+            pass
+    if not token:
+        return jsonify({"status": "error", "message": "Token is missing!"}), 401
+    try:
+        user_id = _token_cache.get(token)
+        if user_id is None:
+            cursor = g.db.cursor()
+            cursor.execute(SQL_SELECT_USER, (token,))
+            row = cursor.fetchone()
+            if not row:
+                return jsonify({"status": "error", "message": "Token is invalid!"}), 401
+            user_id = row[0]
+            _token_cache.set(token, user_id)
+        g.current_user_id = user_id
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return None
 
 @app.route('/events/batch', methods=['POST'])
-@token_required
+@requires_auth
 def submit_events_batch():
-    current_user_id = g.current_user['user_id']
+    current_user_id = g.current_user_id
     events = request.get_json()
     if not isinstance(events, list):
         return jsonify({"status": "error", "message": "Invalid data format"}), 400
     try:
-        with sqlite3.connect('database.sqlite') as conn:
-            cursor = conn.cursor()
-            for event in events:
-                cursor.execute(
-                    "INSERT INTO events_raw (user_id, url, title, start_time, end_time, duration_seconds, tab_id, window_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                    (current_user_id, event.get('url'), event.get('title'), event.get('startTime'), event.get('endTime'), event.get('duration_seconds'), event.get('tabId'), event.get('windowId'))
-                )
-            conn.commit()
+        # 행 튜플을 먼저 만들고 executemany 한 번으로 일괄 INSERT
+        rows = [
+            (current_user_id, event.get('url'), event.get('title'), event.get('startTime'), event.get('endTime'),
+             event.get('duration_seconds'), event.get('tabId'), event.get('windowId'))
+            for event in events
+        ]
+        conn = g.db
+        with conn:  # 성공 시 COMMIT, 예외 시 ROLLBACK
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(SQL_INSERT_EVENT, rows)
         return jsonify({"status": "success", "message": f"{len(events)} events submitted"}), 201
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -56,4 +165,4 @@ def submit_events_batch():
 # ...
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run()
@@ -10,12 +10,17 @@ def create_new_user(user_id):
     try:
         with sqlite3.connect('database.sqlite') as conn:
             cursor = conn.cursor()
-            cursor.execute("INSERT INTO users (user_id, api_token) VALUES (?, ?)", (user_id, new_token))
+            # 중복 user_id 는 예외 대신 ON CONFLICT 로 처리 (rowcount == 0)
+            cursor.execute(
+                "INSERT INTO users (user_id, api_token) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING",
+                (user_id, new_token)
+            )
             conn.commit()
+            if cursor.rowcount == 0:
+                print(f"User '{user_id}' already exists.")
+                return
             print(f"User '{user_id}' created successfully.")
             print(f"API Token: {new_token}")
-    except sqlite3.IntegrityError:
-        print(f"User '{user_id}' already exists.")
     except Exception as e:
         print(f"An error occurred: {e}")
 
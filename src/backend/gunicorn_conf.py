@@ -0,0 +1,12 @@
+# gunicorn 설정: gunicorn -c gunicorn_conf.py wsgi:application
+
+import os
+
+bind = "127.0.0.1:5000"
+workers = 2 * (os.cpu_count() or 1)
+worker_class = "gthread"
+threads = 4
+
+# 앱 import 는 마스터에서 한 번만. SQLite 연결 풀과 토큰 블룸 필터는
+# 첫 요청 때 워커별로 만들어지므로 fork 이후에도 안전 (WAL 모드 필요: init_db.py)
+preload_app = True
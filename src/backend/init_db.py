@@ -4,6 +4,10 @@ import sqlite3
 conn = sqlite3.connect('database.sqlite')
 print("Database connected successfully")
 
+# WAL 모드: 쓰기 중에도 읽기 가능 (journal_mode=WAL 은 DB 파일에 영구 저장됨)
+# synchronous / temp_store / mmap_size 는 연결 단위 설정이라 app.py 의 _open_conn 에서 지정
+conn.execute("PRAGMA journal_mode=WAL")
+
 
 # users 테이블 생성 (사용자 정보 및 API 토큰 저장)
 conn.execute('''
@@ -42,6 +46,9 @@ CREATE TABLE IF NOT EXISTS events_raw (
     window_id INTEGER
 );
 ''')
+# 사용자별 이벤트 조회용 인덱스
+# (users.api_token, features_daily(user_id, analysis_date)는 UNIQUE 제약이 이미 인덱스를 만듦)
+conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events_raw(user_id)")
 print("events_raw table is ready")
 
 # features_daily 테이블 생성
@@ -0,0 +1,3 @@
+# WSGI 진입점: gunicorn -c gunicorn_conf.py wsgi:application
+
+from app import app as application
@@ -2,90 +2,225 @@ import os, json
 import numpy as np
 import pandas as pd
 from typing import Tuple, Dict
-from collections import Counter
 from math import ceil
 
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.metrics import (
-    accuracy_score, precision_score, recall_score, f1_score,
-    roc_auc_score, average_precision_score,
-    precision_recall_curve, confusion_matrix, classification_report
+    f1_score, roc_auc_score, average_precision_score,
+    precision_recall_curve, classification_report
 )
-import joblib, argparse
+import argparse
 
-from src.machine_learning.feature_validation import DataValidator, FeatureValidationError
+from src.machine_learning.feature_validation import DataValidator, FeatureValidationError, FEATURES_DAILY_CONFIG
 from src.machine_learning.data_processor import DataProcessor, DataProcessingError
+from src.machine_learning.artifacts import dump_artifact, export_onnx
+from src.machine_learning.calibration import CalibratedWrapper
+from src.machine_learning.jit import njit, HAVE_NUMBA
 
 # ---------------- utils ----------------
 def _ensure_dir(path: str):
     if path and not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
 
+@njit(cache=True)
+def _best_f1_threshold(y_true, proba):
+    """proba 내림차순으로 한 번 훑으며 TP/FP 누적 → F1 최대 임계값 (동점 구간은 끝에서만 평가)."""
+    order = np.argsort(-proba)
+    n = proba.shape[0]
+    n_pos = 0
+    for i in range(n):
+        if y_true[i] == 1:
+            n_pos += 1
+    tp = 0
+    fp = 0
+    best_thr = 0.5
+    best_f1 = -1.0
+    for k in range(n):
+        i = order[k]
+        if y_true[i] == 1:
+            tp += 1
+        else:
+            fp += 1
+        if k + 1 < n and proba[order[k + 1]] == proba[i]:
+            continue
+        denom = tp + fp + n_pos  # F1 = 2TP / (2TP + FP + FN)
+        f1 = 2.0 * tp / denom if denom > 0 else 0.0
+        if f1 >= best_f1:  # 동점이면 더 낮은 임계값 (precision_recall_curve + argmax 와 동일)
+            best_f1 = f1
+            best_thr = proba[i]
+    return best_thr, best_f1
+
+@njit(cache=True)
+def _confusion_counts(y_true, proba, thr):
+    """임계값 적용 + TP/FP/TN/FN 집계를 한 번의 순회로."""
+    tp = fp = tn = fn = 0
+    for i in range(y_true.shape[0]):
+        if proba[i] >= thr:
+            if y_true[i] == 1:
+                tp += 1
+            else:
+                fp += 1
+        elif y_true[i] == 1:
+            fn += 1
+        else:
+            tn += 1
+    return tp, fp, tn, fn
+
+def confusion_counts(y_true: np.ndarray, proba: np.ndarray, thr: float) -> Tuple[int, int, int, int]:
+    y = np.ascontiguousarray(y_true, dtype=np.int8)
+    p = np.ascontiguousarray(proba, dtype=np.float64)
+    if HAVE_NUMBA:
+        tp, fp, tn, fn = _confusion_counts(y, p, thr)
+        return int(tp), int(fp), int(tn), int(fn)
+    # numba 없음: (label, pred) 조합을 0..3 코드로 만들어 bincount 한 번
+    tn, fp, fn, tp = np.bincount(2 * y + (p >= thr), minlength=4)
+    return int(tp), int(fp), int(tn), int(fn)
+
 def pick_threshold_by_f1(y_true: np.ndarray, proba: np.ndarray) -> Tuple[float, float]:
+    if HAVE_NUMBA and len(proba) > 0:
+        thr, f1 = _best_f1_threshold(np.asarray(y_true, dtype=np.int8),
+                                     np.asarray(proba, dtype=np.float64))
+        return float(thr), float(f1)
     prec, rec, thr = precision_recall_curve(y_true, proba)
     if len(thr) == 0:  # 표본이 아주 적을 때 방어
         y_pred = (proba >= 0.5).astype(int)
         return 0.5, float(f1_score(y_true, y_pred, zero_division=0))
-    f1s = 2 * prec[:-1] * rec[:-1] / np.maximum(prec[:-1] + rec[:-1], 1e-12)
+    p, r = prec[:-1], rec[:-1]
+    s = p + r
+    num = p * r
+    num *= 2
+    f1s = np.zeros_like(s)
+    np.divide(num, s, out=f1s, where=s > 0)
     best_idx = int(np.argmax(f1s))
     return float(thr[best_idx]), float(f1s[best_idx])
 
-def eval_with_threshold(y_true: np.ndarray, proba: np.ndarray, thr: float) -> Dict:
-    y_pred = (proba >= thr).astype(int)
+def threshold_free_aucs(y_true: np.ndarray, proba: np.ndarray) -> Dict:
+    """임계값과 무관한 ROC/PR AUC (정렬 O(n log n)) → 임계값을 바꿔가며 평가할 때 한 번만 계산."""
+    aucs = {}
+    try: aucs["roc_auc"] = float(roc_auc_score(y_true, proba))
+    except Exception: aucs["roc_auc"] = None
+    try: aucs["pr_auc"] = float(average_precision_score(y_true, proba))
+    except Exception: aucs["pr_auc"] = None
+    return aucs
+
+def eval_with_threshold(y_true: np.ndarray, proba: np.ndarray, thr: float, *,
+                        aucs: Dict | None = None) -> Dict:
+    # 지표 4개 + 혼동행렬을 한 번 집계한 TP/FP/TN/FN 에서 계산 (zero_division=0 과 동일)
+    tp, fp, tn, fn = confusion_counts(y_true, proba, thr)
+    n = tp + fp + tn + fn
     m = {
         "threshold": float(thr),
-        "accuracy": float(accuracy_score(y_true, y_pred)),
-        "precision": float(precision_score(y_true, y_pred, zero_division=0)),
-        "recall": float(recall_score(y_true, y_pred, zero_division=0)),
-        "f1": float(f1_score(y_true, y_pred, zero_division=0)),
+        "accuracy": (tp + tn) / n if n else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "f1": 2 * tp / (2 * tp + fp + fn) if tp else 0.0,
     }
-    try: m["roc_auc"] = float(roc_auc_score(y_true, proba))
-    except Exception: m["roc_auc"] = None
-    try: m["pr_auc"] = float(average_precision_score(y_true, proba))
-    except Exception: m["pr_auc"] = None
-    m["confusion_matrix"] = confusion_matrix(y_true, y_pred).tolist()
+    m.update(aucs if aucs is not None else threshold_free_aucs(y_true, proba))
+    m["confusion_matrix"] = [[tn, fp], [fn, tp]]
     return m
 
 def safe_split(X, y, test_size=0.2, random_state=42):
     """표본이 적으면 stratify를 끄고 안전 분할."""
     n = len(y)
     n_test = ceil(test_size * n) if isinstance(test_size, float) else int(test_size)
-    n_classes = len(set(y))
-    cnt = Counter(y)
-    can_stratify = (min(cnt.values()) >= 2) and (n_test >= n_classes)
+    counts = np.bincount(np.asarray(y, dtype=np.int64))  # 라벨은 0/1 정수
+    counts = counts[counts > 0]
+    n_classes = counts.size
+    min_c = int(counts.min()) if n_classes else 0
+    can_stratify = (min_c >= 2) and (n_test >= n_classes)
     if not can_stratify:
         print("⚠️ safe_split: falling back to non-stratified split "
-              f"(n={n}, test={n_test}, classes={n_classes}, min_class={min(cnt.values())})")
+              f"(n={n}, test={n_test}, classes={n_classes}, min_class={min_c})")
     return train_test_split(
         X, y, test_size=test_size, random_state=random_state,
         stratify=y if can_stratify else None
     )
 
+def read_feature_csv(data_path: str, config: Dict) -> pd.DataFrame:
+    """필요한 컬럼만 dtype 을 지정해 pyarrow 엔진으로 읽음. 실패 시(미설치/컬럼 누락/형변환 불가) 기본 로더."""
+    # 실수 컬럼은 float64 유지 (float32 로 줄이면 비율 경계/음수 검사 결과가 달라질 수 있음)
+    dtype_map = {c: "float64" for c in config["float_columns"] + config["ratio_columns"]}
+    # 정수 컬럼은 결측 허용 Int32, 라벨은 int8. 소수 등 변환 불가 값은 ValueError → 기본 로더 + 검증기가 잡아냄
+    dtype_map.update({c: "Int32" for c in config["int_columns"]})
+    if "depression_label" in config["expected_columns"]:
+        dtype_map["depression_label"] = "int8"
+    try:
+        return pd.read_csv(data_path, engine="pyarrow",
+                           usecols=config["expected_columns"], dtype=dtype_map)
+    except (ImportError, ValueError) as e:
+        print(f"⚠️ Fast CSV load failed ({e}); falling back to default reader")
+        return pd.read_csv(data_path)
+
+def _cuda_available() -> bool:
+    """cupy 가 있고 CUDA 장치가 1개 이상일 때만 True."""
+    try:
+        import cupy as cp
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except Exception:  # cupy 미설치 / 드라이버 없음
+        return False
+
+def build_base_estimator(kind: str, seed: int = 42, accel: bool = False, gpu: bool = False):
+    """학습기 생성. hgb: 히스토그램 기반 GBM (기본, 빠른 학습/작은 모델), lgbm: LightGBM (설치 시), rf: 기존 RandomForest."""
+    if kind == "hgb":
+        return HistGradientBoostingClassifier(
+            max_iter=300, learning_rate=0.05, class_weight="balanced",
+            early_stopping="auto", validation_fraction=0.1, random_state=seed
+        )
+    if kind == "lgbm":
+        try:
+            import lightgbm as lgb  # 선택 의존성
+        except ImportError as e:
+            raise ImportError("--model lgbm 은 lightgbm 설치가 필요합니다 (pip install lightgbm).") from e
+        # val 은 보정/임계값 선택용이므로 early stopping 에 쓰지 않음 (누수 방지)
+        return lgb.LGBMClassifier(
+            objective="binary", n_estimators=300, num_leaves=31, learning_rate=0.05,
+            class_weight="balanced", n_jobs=-1, random_state=seed, verbose=-1
+        )
+    if kind == "rf" and gpu:
+        if _cuda_available():
+            try:
+                from cuml.ensemble import RandomForestClassifier as CuRF
+                # cuML 은 class_weight/n_jobs 미지원. numpy 입력 → numpy 출력 (보정/평가 코드 그대로 사용)
+                return CuRF(
+                    n_estimators=60, max_depth=12, min_samples_leaf=5, max_features="sqrt",
+                    bootstrap=True, max_samples=0.8, random_state=seed, output_type="numpy"
+                )
+            except ImportError:
+                print("⚠️ --gpu: cuML 미설치, CPU RandomForest 사용")
+        else:
+            print("⚠️ --gpu: CUDA 장치 없음, CPU RandomForest 사용")
+    if kind == "rf":
+        rf_cls = RandomForestClassifier
+        if accel:
+            # sklearnex(oneDAL) 구현을 직접 사용 → 전역 patch_sklearn() 없이 rf 에만 적용
+            try:
+                from sklearnex.ensemble import RandomForestClassifier as rf_cls
+            except ImportError:
+                print("⚠️ --accel: sklearnex 미설치, 기본 scikit-learn RandomForest 사용")
+        # 깊이/리프 크기 제한 + 부트스트랩 샘플 80% → 학습/추론 비용과 model.pkl 크기 축소
+        return rf_cls(
+            n_estimators=60, max_depth=12, min_samples_leaf=5, max_features="sqrt",
+            bootstrap=True, max_samples=0.8, class_weight="balanced", random_state=seed, n_jobs=-1
+        )
+    raise ValueError(f"알 수 없는 모델 종류: {kind}")
+
 # --------------- training ---------------
-def train_and_save_model_advanced(data_path: str, out_dir: str = "artifacts", seed: int = 42):
+def train_and_save_model_advanced(data_path: str, out_dir: str = "artifacts", seed: int = 42,
+                                  model: str = "hgb", accel: bool = False, gpu: bool = False):
     _ensure_dir(out_dir)
 
+    # 10개 피처 스키마 + 라벨
+    config = dict(FEATURES_DAILY_CONFIG,
+                  expected_columns=FEATURES_DAILY_CONFIG["expected_columns"] + ["depression_label"])
+
     # 1) load
-    df = pd.read_csv(data_path)
+    df = read_feature_csv(data_path, config)
     print(f"✅ Loaded data: {data_path} (rows={len(df)})")
 
     # 2) validate
-    config = {
-    "expected_columns": [
-        "total_usage_daily","total_usage_weekly",
-        "late_night_ratio","sns_ent_ratio",
-        "session_length_max","session_length_mean",
-        "bounce_ratio","avg_tab_cnt","search_freq","repeat_site_ratio",
-        "depression_label"
-    ],
-    "ratio_columns": ["late_night_ratio","sns_ent_ratio","bounce_ratio","repeat_site_ratio"],
-    "float_columns": ["total_usage_daily","total_usage_weekly","session_length_max","session_length_mean"],
-    "int_columns": ["avg_tab_cnt","search_freq"],
-    "date_columns": []
-}
-    report, df_valid, _ = DataValidator(df, config).validate_features()
+    validator = DataValidator(df, config)
+    report, df_valid, _ = validator.validate_features(write_failures=True)
     if report.get("problems", 0) > 0:
         raise FeatureValidationError("유효성 검사 실패. feature_validation_failures.csv 확인 요망.")
     print("✅ Validation passed")
@@ -100,59 +235,58 @@ def train_and_save_model_advanced(data_path: str, out_dir: str = "artifacts", se
     print(f"✅ Split: train={len(X_tr)}, test={len(X_te)}")
 
     # 4) preprocess (fit on train only)
+    # 모델 입력 = 스케일된 피처만, float32 행렬 (avg_tab_cnt/문자열 컬럼 제외, select_dtypes 복사 없음)
     processor = DataProcessor(X_tr)
-    X_tr_p, _meta = processor.fit_transform()
-    X_te_p = processor.transform(X_te)
-    # 숫자형만 최종 사용 (datetime 등 비수치형 제거)
-    import numpy as _np
-    X_tr_p = X_tr_p.select_dtypes(include=[_np.number]).copy()
-    X_te_p = X_te_p.select_dtypes(include=[_np.number]).copy()
-    print("✅ Preprocessing done (numeric-only)")
+    X_tr_p, feature_names, _meta = processor.fit_transform_numpy()
+    X_te_p = processor.transform_numpy(X_te)
+    print(f"✅ Preprocessing done (features={len(feature_names)}, float32)")
 
     # 5) inner split for threshold tuning
     X_tr_in, X_val, y_tr_in, y_val = safe_split(X_tr_p, y_tr, test_size=0.2, random_state=seed)
-    # 혹시 모를 dtype 섞임 방지
-    import numpy as _np
-    X_tr_in = X_tr_in.select_dtypes(include=[_np.number]).copy()
-    X_val   = X_val.select_dtypes(include=[_np.number]).copy()
-    print(f"✅ Inner split: train_in={len(X_tr_in)}, val={len(X_val)} (numeric-only)")
+    print(f"✅ Inner split: train_in={len(X_tr_in)}, val={len(X_val)}")
 
     # 6) model (+ optional calibration)
-    base = RandomForestClassifier(n_estimators=300, class_weight="balanced", random_state=seed, n_jobs=-1)
+    base = build_base_estimator(model, seed, accel=accel, gpu=gpu)
+    base.fit(X_tr_in, y_tr_in)  # 한 번만 학습 (cv=k 처럼 k번 재학습하지 않음)
 
-    # 표본이 매우 적으면 보정 생략, 아니면 cv를 안전하게 축소
-    counts = np.bincount(y_tr_in) if len(y_tr_in) else np.array([])
+    # val 을 보정용(cal)/임계값용(thr)으로 반씩 나눔. 표본이 매우 적으면 보정 생략
+    counts = np.bincount(y_val) if len(y_val) else np.array([])
     min_class = counts.min() if counts.size > 0 else 0
-    if len(y_tr_in) < 10 or min_class < 2:
-        print("⚠️ Small train_in; skipping calibration (using raw RandomForest)")
-        base.fit(X_tr_in, y_tr_in)
+    if len(y_val) < 10 or min_class < 4:  # 반으로 나눈 cal 에도 클래스별 2개 이상
+        print(f"⚠️ Small val; skipping calibration (using raw {model} model)")
         clf = base
+        X_thr, y_thr = X_val, y_val
     else:
-        folds = max(2, min(5, int(min_class)))
-        clf = CalibratedClassifierCV(estimator=base, method="isotonic", cv=folds)
-        clf.fit(X_tr_in, y_tr_in)
-        print(f"✅ Model trained & calibrated (cv={folds})")
+        X_cal, X_thr, y_cal, y_thr = safe_split(X_val, y_val, test_size=0.5, random_state=seed)
+        # 학습된 base 의 cal 확률에 isotonic 보정기 1개만 학습 (재학습 없음, sklearn 버전 무관)
+        clf = CalibratedWrapper.fit(base, X_cal, y_cal)
+        print(f"✅ Model trained & calibrated (isotonic, cal={len(y_cal)}, thr={len(y_thr)})")
 
-    # 7) pick threshold on val
-    val_proba = (clf.predict_proba(X_val)[:, 1]
+    # 7) pick threshold on held-out val slice
+    val_proba = (clf.predict_proba(X_thr)[:, 1]
                  if hasattr(clf, "predict_proba") else
-                 1/(1+np.exp(-clf.decision_function(X_val))) )
-    best_thr, best_f1 = pick_threshold_by_f1(y_val.to_numpy(), val_proba)
+                 1/(1+np.exp(-clf.decision_function(X_thr))) )
+    best_thr, best_f1 = pick_threshold_by_f1(y_thr.to_numpy(), val_proba)
     print(f"✅ Threshold(F1-max) = {best_thr:.4f} (val F1={best_f1:.4f})")
 
     # 8) evaluate on test
     te_proba = (clf.predict_proba(X_te_p)[:, 1]
                 if hasattr(clf, "predict_proba") else
                 1/(1+np.exp(-clf.decision_function(X_te_p))) )
-    test_metrics = eval_with_threshold(y_te.to_numpy(), te_proba, best_thr)
+    y_te_np = y_te.to_numpy()
+    test_metrics = eval_with_threshold(y_te_np, te_proba, best_thr, aucs=threshold_free_aucs(y_te_np, te_proba))
     print("\n=== Test metrics (selected threshold) ===")
     print(json.dumps(test_metrics, indent=2, ensure_ascii=False))
     print("\n[Ref] 0.5 default report")
-    print(classification_report(y_te, (te_proba >= 0.5).astype(int)))
+    # clf.predict() 를 다시 부르지 않고 이미 계산한 te_proba 재사용
+    te_pred_default = (te_proba >= 0.5).astype(np.int8)
+    print(classification_report(y_te, te_pred_default))
 
     # 9) save artifacts
-    joblib.dump(clf,        os.path.join(out_dir, "model.pkl"))
-    joblib.dump(processor,  os.path.join(out_dir, "processor.pkl"))
+    dump_artifact(clf,       os.path.join(out_dir, "model.pkl"))  # lz4 설치 시 압축
+    dump_artifact(processor, os.path.join(out_dir, "processor.pkl"))
+    if export_onnx(clf, X_tr_in[:1], out_dir):  # skl2onnx 설치 + 변환 가능한 모델일 때만
+        print("✅ Exported model.onnx")
     with open(os.path.join(out_dir, "threshold.json"), "w", encoding="utf-8") as f:
         json.dump({"threshold": best_thr, "method": "f1max",
                    "metrics": {"val_f1": best_f1, **test_metrics}}, f, indent=2, ensure_ascii=False)
@@ -165,8 +299,15 @@ def parse_args():
     ap.add_argument("--data", required=True, help="CSV with features + depression_label")
     ap.add_argument("--out",  default="artifacts", help="Output artifacts directory")
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--model", choices=["hgb", "lgbm", "rf"], default="hgb",
+                    help="hgb: HistGradientBoosting (default), lgbm: LightGBM (optional dependency), rf: RandomForest")
+    ap.add_argument("--accel", action="store_true",
+                    help="Use the Intel sklearnex (oneDAL) RandomForest for --model rf, if installed")
+    ap.add_argument("--gpu", action="store_true",
+                    help="Train --model rf with cuML on a CUDA device, if available")
     return ap.parse_args()
 
 if __name__ == "__main__":
     args = parse_args()
-    train_and_save_model_advanced(data_path=args.data, out_dir=args.out, seed=args.seed)
+    train_and_save_model_advanced(data_path=args.data, out_dir=args.out, seed=args.seed, model=args.model,
+                                  accel=args.accel, gpu=args.gpu)
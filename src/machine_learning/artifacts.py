@@ -1,6 +1,21 @@
 import os
 import json
 import joblib
+import numpy as np
+
+from src.machine_learning.calibration import CalibratedWrapper
+
+ONNX_FILE = "model.onnx"
+
+try:
+    import lz4  # noqa: F401  (enables joblib's lz4 compressor)
+    PICKLE_COMPRESS = ("lz4", 3)
+except ImportError:
+    PICKLE_COMPRESS = 0
+
+def dump_artifact(obj, path: str):
+    """joblib.dump with LZ4 compression when lz4 is installed; joblib.load reads either form."""
+    joblib.dump(obj, path, compress=PICKLE_COMPRESS)
 
 def load_model_processor(art_dir: str):
     """Load model.pkl and processor.pkl from artifacts directory."""
@@ -21,3 +36,49 @@ def load_threshold(art_dir: str, default: float = 0.5) -> float:
     if isinstance(data.get("metrics"), dict) and "threshold" in data["metrics"]:
         return float(data["metrics"]["threshold"])
     return float(default)
+
+def export_onnx(model, X_sample, art_dir: str) -> bool:
+    """
+    Convert a fitted model to ONNX (model.onnx) when skl2onnx is installed.
+    A CalibratedWrapper is exported as its base model; load_onnx_proba applies
+    the calibrator to the ONNX probabilities.
+    Returns False (and removes any stale model.onnx) if the model cannot be converted.
+    """
+    path = os.path.join(art_dir, ONNX_FILE)
+    if isinstance(model, CalibratedWrapper):  # skl2onnx 는 래퍼를 모름 → base 모델만 변환
+        model = model.base
+    try:
+        from skl2onnx import to_onnx
+        sample = np.asarray(X_sample, dtype=np.float32)[:1]
+        onx = to_onnx(model, sample, options={id(model): {"zipmap": False}})
+    except Exception as e:  # skl2onnx 미설치 또는 미지원 모델
+        print(f"⚠️ ONNX export skipped ({type(e).__name__}: {str(e)[:200]})")
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    with open(path, "wb") as f:
+        f.write(onx.SerializeToString())
+    return True
+
+def load_onnx_proba(art_dir: str, calibrator=None):
+    """
+    Return a positive-class probability function backed by ONNX Runtime,
+    or None if model.onnx or onnxruntime is unavailable.
+    calibrator (e.g. CalibratedWrapper.calibrator) maps the raw ONNX probabilities.
+    """
+    path = os.path.join(art_dir, ONNX_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+    input_name = sess.get_inputs()[0].name
+
+    def predict_proba(X) -> np.ndarray:
+        p = sess.run(None, {input_name: np.asarray(X, dtype=np.float32)})[1][:, 1]
+        return p if calibrator is None else calibrator.predict(p)
+    return predict_proba
@@ -0,0 +1,38 @@
+import numpy as np
+from sklearn.isotonic import IsotonicRegression
+
+
+class CalibratedWrapper:
+    """
+    A fitted binary classifier plus an isotonic map on its positive-class probability.
+
+    The base model is trained once; only the 1-D isotonic calibrator is fit on the
+    held-out calibration slice, so no fold-wise retraining is needed.
+    """
+
+    def __init__(self, base, calibrator: IsotonicRegression):
+        self.base = base
+        self.calibrator = calibrator
+
+    @classmethod
+    def fit(cls, base, X_cal, y_cal) -> "CalibratedWrapper":
+        """Fit an isotonic calibrator on the (already fitted) base model's probabilities."""
+        raw = base.predict_proba(X_cal)[:, 1]
+        iso = IsotonicRegression(out_of_bounds="clip", y_min=0.0, y_max=1.0)
+        iso.fit(raw, np.asarray(y_cal))
+        return cls(base, iso)
+
+    @property
+    def classes_(self):
+        return self.base.classes_
+
+    @property
+    def feature_names_in_(self):
+        return self.base.feature_names_in_  # AttributeError if the base has none
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self.calibrator.predict(self.base.predict_proba(X)[:, 1])
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[(self.predict_proba(X)[:, 1] >= 0.5).astype(int)]
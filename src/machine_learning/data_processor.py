@@ -1,5 +1,8 @@
+import warnings
 from typing import List, Dict, Tuple
+import numpy as np
 import pandas as pd
+from pandas.arrays import IntegerArray
 from sklearn.preprocessing import StandardScaler
 
 
@@ -16,13 +19,13 @@ class DataProcessor:
     1. Validate required feature columns.
     2. Convert to numeric dtype.
     3. Handle missing values:
-       - Numeric columns: fill with median.
+       - Numeric columns: fill with median (learned in fit_transform, reused by transform).
        - Integer columns: fill with median, round, cast to Int64.
        - Ratio columns: fill with 0.0, clip to [0, 1].
     4. Logical correction:
        - If session_length_max < session_length_mean → swap.
     5. Set avg_tab_cnt = 0 (excluded from scaling and learning)
-    6. Standardize all remaining features using StandardScaler.
+    6. Standardize all remaining features using StandardScaler (float32 input/output).
     """
 
     REQUIRED_COLUMNS: List[str] = [
@@ -48,6 +51,7 @@ class DataProcessor:
         self.df = df
         self._scaler: StandardScaler | None = None
         self._scale_cols: List[str] = []
+        self._medians: Dict[str, float] | None = None  # fill values learned in fit_transform
 
     # ---------- Internal helpers ----------
     def _validate_shape(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -57,48 +61,71 @@ class DataProcessor:
             raise DataProcessingError(f"Missing required columns: {missing}")
         return df.copy()
 
-    def _preprocess(self, df: pd.DataFrame) -> pd.DataFrame:
+    @staticmethod
+    def _to_nullable_int(arr: np.ndarray) -> IntegerArray:
+        """Round and build an Int64 array straight from a float buffer and its NaN mask."""
+        arr = np.rint(arr)
+        mask = np.isnan(arr)
+        vals = np.zeros(arr.shape, dtype=np.int64)
+        np.copyto(vals, arr, casting="unsafe", where=~mask)
+        return IntegerArray(vals, mask)
+
+    def _preprocess(self, df: pd.DataFrame,
+                    medians: Dict[str, float] | None = None) -> Tuple[pd.DataFrame, Dict[str, float]]:
         """
         Convert types, handle NaNs, apply logical corrections.
-        Returns a clean numeric DataFrame ready for scaling.
+        Numeric/integer NaNs are filled with `medians` when given (fitted values),
+        otherwise with this frame's medians.
+        Returns (clean numeric DataFrame ready for scaling, medians used).
         """
         out = df.copy()
+        num = [c for c in self.NUMERIC_COLUMNS if c in out.columns]
+        ints = [c for c in self.INTEGER_COLUMNS if c in out.columns]
+        ratio = [c for c in self.RATIO_COLUMNS if c in out.columns]
+        cols = num + ints + ratio
 
         # 1. Coerce columns to numeric (force NaN on invalid)
-        for c in self.NUMERIC_COLUMNS + self.RATIO_COLUMNS + self.INTEGER_COLUMNS:
-            if c in out.columns:
+        for c in cols:
+            if not pd.api.types.is_numeric_dtype(out[c]):  # already-numeric columns need no copy
                 out[c] = pd.to_numeric(out[c], errors="coerce")
 
-        # 2. Fill missing numeric columns with median
-        for c in self.NUMERIC_COLUMNS:
-            if c in out.columns:
-                median_val = out[c].median(skipna=True)
-                out[c] = out[c].fillna(median_val)
+        # Steps 2-4 run on one float matrix laid out as [numeric | integer | ratio]
+        M = out[cols].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)  # filled in place below
+        k = len(num) + len(ints)
 
-        # 3. Fill and cast integer columns
-        for c in self.INTEGER_COLUMNS:
-            if c in out.columns:
-                median_val = out[c].median(skipna=True)
-                out[c] = out[c].fillna(median_val).round().astype("Int64")
+        # 2-3. Fill numeric and integer columns with their medians
+        head = M[:, :k]
+        if medians is not None:
+            med = np.array([medians.get(c, np.nan) for c in cols[:k]], dtype=np.float64)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN column → median stays NaN
+                med = np.nanmedian(head, axis=0)
+        np.copyto(head, med, where=np.isnan(head))
 
         # 4. Fill ratio columns with 0 and clip to [0, 1]
-        for c in self.RATIO_COLUMNS:
-            if c in out.columns:
-                out[c] = out[c].fillna(0.0).clip(lower=0.0, upper=1.0)
+        tail = M[:, k:]
+        tail[np.isnan(tail)] = 0.0
+        np.clip(tail, 0.0, 1.0, out=tail)
+
+        for j, c in enumerate(cols):
+            # Integer columns: round and cast to Int64
+            out[c] = self._to_nullable_int(M[:, j]) if len(num) <= j < k else M[:, j]
 
         # 5. Logical correction: ensure session_length_max ≥ session_length_mean
         if {"session_length_max", "session_length_mean"}.issubset(out.columns):
-            mask = out["session_length_max"] < out["session_length_mean"]
-            if mask.any():
-                out.loc[mask, ["session_length_max", "session_length_mean"]] = (
-                    out.loc[mask, ["session_length_mean", "session_length_max"]].values
-                )
+            mx = out["session_length_max"].to_numpy()
+            mn = out["session_length_mean"].to_numpy()
+            swap = mx < mn  # NaN compares False → left as is, like the old .loc swap
+            if swap.any():
+                out["session_length_max"] = np.where(swap, mn, mx)
+                out["session_length_mean"] = np.where(swap, mx, mn)
 
         # 6. Force avg_tab_cnt = 0 (always constant)
         if "avg_tab_cnt" in out.columns:
             out["avg_tab_cnt"] = 0
 
-        return out
+        return out, dict(zip(cols[:k], med.tolist()))
 
     # ---------- Public API ----------
     def fit_transform(self) -> Tuple[pd.DataFrame, Dict]:
@@ -107,7 +134,7 @@ class DataProcessor:
         Returns (processed_df, meta_info).
         """
         df_validated = self._validate_shape(self.df)
-        df_processed = self._preprocess(df_validated)
+        df_processed, self._medians = self._preprocess(df_validated)
 
         # Determine columns to scale (exclude avg_tab_cnt)
         self._scale_cols = [
@@ -117,11 +144,24 @@ class DataProcessor:
 
         self._scaler = StandardScaler()
         if self._scale_cols:
-            df_processed[self._scale_cols] = self._scaler.fit_transform(df_processed[self._scale_cols])
+            mat = df_processed[self._scale_cols].to_numpy(dtype=np.float32)
+            df_processed[self._scale_cols] = self._scaler.fit_transform(mat)
 
-        meta = {"scaled_columns": self._scale_cols, "scaler": self._scaler}
+        meta = {"scaled_columns": self._scale_cols, "scaler": self._scaler, "medians": self._medians}
         return df_processed, meta
 
+    def fit_transform_numpy(self) -> Tuple[np.ndarray, List[str], Dict]:
+        """
+        Same as fit_transform(), but return only the model features (the scaled columns)
+        as one float32 matrix: (X, feature_names, meta_info).
+        """
+        df_processed, meta = self.fit_transform()
+        return df_processed[self._scale_cols].to_numpy(dtype=np.float32), self.get_feature_names_out(), meta
+
+    def get_feature_names_out(self) -> List[str]:
+        """Column order of the matrices returned by fit_transform_numpy()/transform_numpy()."""
+        return list(self._scale_cols)
+
     def transform(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Apply the previously fitted scaler to new data.
@@ -131,9 +171,20 @@ class DataProcessor:
             raise DataProcessingError("fit_transform() must be called before transform().")
 
         df_validated = self._validate_shape(df)
-        df_processed = self._preprocess(df_validated)
+        # Fill with the training medians (older pickles without them fall back to batch medians)
+        df_processed, _ = self._preprocess(df_validated, medians=getattr(self, "_medians", None))
 
         if self._scale_cols:
-            df_processed[self._scale_cols] = self._scaler.transform(df_processed[self._scale_cols])
+            if hasattr(self._scaler, "feature_names_in_"):
+                # Processors pickled before the float32 change were fitted on a float64 DataFrame:
+                # scale exactly as they were trained (no feature-name warning, no float32 rounding)
+                mat = df_processed[self._scale_cols].astype(np.float64)
+            else:
+                mat = df_processed[self._scale_cols].to_numpy(dtype=np.float32)
+            df_processed[self._scale_cols] = self._scaler.transform(mat)
 
         return df_processed
+
+    def transform_numpy(self, df: pd.DataFrame) -> np.ndarray:
+        """transform() restricted to the model features, as a float32 matrix."""
+        return self.transform(df)[self._scale_cols].to_numpy(dtype=np.float32)
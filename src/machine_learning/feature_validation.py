@@ -1,6 +1,87 @@
+import csv
+from itertools import repeat
+
+import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple
 
+from src.machine_learning.jit import njit, prange, HAVE_NUMBA
+
+try:
+    import numexpr as ne  # optional: fused evaluation of multi-term masks
+    HAVE_NUMEXPR = True
+except ImportError:
+    ne = None
+    HAVE_NUMEXPR = False
+
+FAILURE_CSV = "feature_validation_failures.csv"
+FAILURE_COLUMNS = ["index", "column", "reason", "value"]
+# Columns read by _check_logical_consistency
+LOGICAL_COLUMNS = ["session_length_max", "session_length_mean", "total_usage_daily", "total_usage_weekly"]
+
+# Row count from which the compiled rule kernel beats the NumPy masks (when numba is available)
+NUMBA_MIN_ROWS = 100_000
+# Row count from which numexpr's fused evaluation beats NumPy temporaries (when numexpr is available)
+NUMEXPR_MIN_ROWS = 100_000
+
+# Shared validation config for the 10-feature `features_daily` schema (training / prediction)
+FEATURES_DAILY_CONFIG: Dict[str, List[str]] = {
+    "expected_columns": [
+        "total_usage_daily", "total_usage_weekly",
+        "late_night_ratio", "sns_ent_ratio",
+        "session_length_max", "session_length_mean",
+        "bounce_ratio", "avg_tab_cnt", "search_freq", "repeat_site_ratio"
+    ],
+    "ratio_columns": ["late_night_ratio", "sns_ent_ratio", "bounce_ratio", "repeat_site_ratio"],
+    "float_columns": ["total_usage_daily", "total_usage_weekly", "session_length_max", "session_length_mean"],
+    "int_columns": ["avg_tab_cnt", "search_freq"],
+    "date_columns": []
+}
+
+
+@njit(parallel=True, cache=True)
+def _scan_rules(arr, nr, nf):
+    """
+    One pass over the stacked (ratio | float | int) block → (out_of_bounds, negative, fractional)
+    masks for the ratio, float+int and int slices respectively. NaN fails every test.
+    """
+    n, k = arr.shape
+    oob = np.zeros((n, nr), dtype=np.bool_)
+    neg = np.zeros((n, k - nr), dtype=np.bool_)
+    frac = np.zeros((n, k - nr - nf), dtype=np.bool_)
+    for i in prange(n):
+        for j in range(nr):
+            v = arr[i, j]
+            oob[i, j] = v < 0.0 or v > 1.0
+        for j in range(nr, k):
+            v = arr[i, j]
+            neg[i, j - nr] = v < 0.0
+            if j >= nr + nf and np.isfinite(v):
+                frac[i, j - nr - nf] = v != np.floor(v)
+    return oob, neg, frac
+
+
+@njit(parallel=True, cache=True)
+def _scan_logical(mx, mn, daily, weekly, R):
+    """
+    One pass over the rows for all logical rules → (max < mean, weekly < daily, zero usage
+    with non-zero ratio) masks. NaN usage counts as zero; NaN everywhere else fails the test.
+    """
+    n, k = R.shape
+    max_lt = np.zeros(n, dtype=np.bool_)
+    weekly_lt = np.zeros(n, dtype=np.bool_)
+    zero_bad = np.zeros((n, k), dtype=np.bool_)
+    for i in prange(n):
+        max_lt[i] = mx[i] < mn[i]
+        weekly_lt[i] = weekly[i] + 1e-9 < daily[i]
+        d = daily[i]
+        if not (d > 0.0 or d < 0.0):
+            for j in range(k):
+                r = R[i, j]
+                zero_bad[i, j] = r > 0.0 or r < 0.0
+    return max_lt, weekly_lt, zero_bad
+
+
 class FeatureValidationError(Exception):
     """Raised when feature validation fails."""
     pass
@@ -18,30 +99,40 @@ class DataValidator:
     - Logical consistency (e.g., max >= mean, weekly >= daily)
     - Integer integrity (search_freq must be integer)
     - Conditional logic (if total_usage_daily == 0 → ratio features must be 0)
+    - Date parsing (date_columns)
+
+    Column groups default to the `features_daily` schema below; callers may
+    override any of them through `config` (keys: expected_columns,
+    ratio_columns, float_columns, int_columns, date_columns).
     """
 
-    def __init__(self, df: pd.DataFrame):
-        self.df = df.copy()
+    def __init__(self, df: pd.DataFrame, config: Dict | None = None):
+        self.df = df  # read-only; coerced values live in self._df_num
         self.report: Dict = {"checks": [], "problems": 0, "warnings": 0, "issues_summary": []}
-        self.failure_rows: List[Dict] = []
+        # Failing rows, column-wise: one entry per failing (column, rule) chunk in each list
+        self._fail_cols: Dict[str, List] = {"index": [], "column": [], "reason": [], "value": []}
         self._df_num: pd.DataFrame | None = None
+        self._cols: Dict[str, np.ndarray] = {}  # float64 view of each numeric column, filled once
+        self._index_arr: np.ndarray | None = None  # row labels of _df_num, for failure records
+        config = config or {}
 
         # ✅ Expected feature columns from features_daily table
-        self.expected_columns: List[str] = [
+        self.expected_columns: List[str] = list(config.get("expected_columns", [
             "total_usage_daily", "total_usage_weekly", "late_night_ratio", "sns_ent_ratio",
             "session_length_max", "session_length_mean", "bounce_ratio",
             "avg_tab_cnt", "search_freq", "repeat_site_ratio"
-        ]
+        ]))
 
         # ✅ Grouped by type
-        self.ratio_columns: List[str] = [
+        self.ratio_columns: List[str] = list(config.get("ratio_columns", [
             "late_night_ratio", "sns_ent_ratio", "bounce_ratio", "repeat_site_ratio"
-        ]
-        self.float_columns: List[str] = [
+        ]))
+        self.float_columns: List[str] = list(config.get("float_columns", [
             "total_usage_daily", "total_usage_weekly",
             "session_length_max", "session_length_mean", "avg_tab_cnt"
-        ]
-        self.int_columns: List[str] = ["search_freq"]
+        ]))
+        self.int_columns: List[str] = list(config.get("int_columns", ["search_freq"]))
+        self.date_columns: List[str] = list(config.get("date_columns", []))
 
     # ---------------- Utility helpers ----------------
     def _add_issue(self, column: str, rule: str, count: int, is_warning: bool = False):
@@ -57,17 +148,104 @@ class DataValidator:
         else:
             self.report["problems"] += count
 
-    def _record_failures(self, df: pd.DataFrame, col: str, reason: str):
-        """Store each failing row for detailed CSV logging."""
-        if df.empty:
+    def _record_failures(self, positions: np.ndarray, col: str, reason: str, values: np.ndarray):
+        """Store failing rows (given by position) as one array chunk for CSV logging."""
+        if positions.size == 0:
+            return
+        fc = self._fail_cols
+        fc["index"].append(self._index_arr[positions])
+        fc["column"].append(col)
+        fc["reason"].append(reason)
+        fc["value"].append(values[positions])
+
+    def _record_grid(self, cols: List[str], arr: np.ndarray, bad: np.ndarray, rule: str, reason: str):
+        """Record a whole (rows x cols) failure mask at once: one nonzero scan, then split per column."""
+        col_idx, positions = np.nonzero(bad.T)  # column-major, so each column's rows stay grouped
+        if positions.size == 0:
             return
-        for idx in df.index:
-            self.failure_rows.append({"index": idx, "column": col, "reason": reason})
+        counts = np.bincount(col_idx, minlength=len(cols))
+        for j, pos in enumerate(np.split(positions, np.cumsum(counts)[:-1])):
+            if pos.size:
+                self._add_issue(cols[j], rule, len(pos))
+                self._record_failures(pos, cols[j], reason, arr[:, j])
+
+    def _failure_count(self) -> int:
+        """Number of recorded failure rows."""
+        return sum(len(idx) for idx in self._fail_cols["index"])
+
+    @staticmethod
+    def _repeat_labels(labels: List[str], lengths: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Expand one label per chunk to one per row as (int16 codes, categories)."""
+        categories, codes = np.unique(labels, return_inverse=True)
+        return np.repeat(codes.astype(np.int16), lengths), categories
+
+    @staticmethod
+    def _format_values(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Failure values as text the way pandas prints them (-2.0, 1e-05), plus the missing mask."""
+        return values.astype(str), pd.isna(values)
+
+    def _failure_frame(self) -> pd.DataFrame:
+        """Assemble the failure columns into one DataFrame (columns built once, not per row)."""
+        fc = self._fail_cols
+        if not fc["index"]:
+            return pd.DataFrame()
+        lengths = [len(i) for i in fc["index"]]
+        return pd.DataFrame({
+            "index": np.concatenate(fc["index"]),
+            "column": pd.Categorical.from_codes(*self._repeat_labels(fc["column"], lengths)),
+            "reason": pd.Categorical.from_codes(*self._repeat_labels(fc["reason"], lengths)),
+            "value": np.concatenate(fc["value"]),
+        })
+
+    def _write_failures(self, path: str = FAILURE_CSV):
+        """
+        Write failure rows with PyArrow's CSV writer; fall back to streaming via csv.writer.
+        With no failing rows (only missing columns / whole-column problems) the file is header-only.
+        """
+        if not self._fail_cols["index"]:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                f.write(",".join(FAILURE_COLUMNS) + "\n")
+            return
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pacsv
+        except ImportError:
+            pa = None
+        if pa is not None:
+            try:
+                # Arrow table straight from the failure chunks (no intermediate DataFrame);
+                # labels stay dictionary-encoded until the writer formats them
+                fc = self._fail_cols
+                lengths = [len(i) for i in fc["index"]]
+                labels = [pa.DictionaryArray.from_arrays(*self._repeat_labels(fc[k], lengths))
+                          for k in ("column", "reason")]
+                # Values pre-formatted: Arrow would print -2.0 as -2 and 1e-05 as 0.00001
+                text, na = self._format_values(np.concatenate(fc["value"]))
+                table = pa.table([pa.array(np.concatenate(fc["index"])), *labels,
+                                  pa.array(text, type=pa.string(), mask=na)], names=FAILURE_COLUMNS)
+                # Unquoted, like the csv module; values that would need quotes raise → fallback
+                opts = pacsv.WriteOptions(include_header=False, quoting_style="none")
+                with open(path, "wb") as f:
+                    f.write((",".join(FAILURE_COLUMNS) + "\n").encode("utf-8"))
+                    pacsv.write_csv(table, f, write_options=opts)
+                return
+            except (pa.ArrowException, TypeError) as e:
+                print(f"⚠️ Arrow CSV write failed ({e}); falling back to csv module")
+
+        fc = self._fail_cols
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FAILURE_COLUMNS)
+            for idx, col, reason, vals in zip(fc["index"], fc["column"], fc["reason"], fc["value"]):
+                text, na = self._format_values(vals)
+                text[na] = ""
+                writer.writerows(zip(idx.tolist(), repeat(col), repeat(reason), text.tolist()))
 
     # ---------------- Validation steps ----------------
     def _check_missing_columns(self):
         """Ensure all expected feature columns exist."""
-        missing = [c for c in self.expected_columns if c not in self.df.columns]
+        present = set(self.df.columns)
+        missing = [c for c in self.expected_columns if c not in present]
         self.report["checks"].append({"check": "required_columns", "missing": missing,
                                       "status": "pass" if not missing else "fail"})
         if missing:
@@ -75,106 +253,167 @@ class DataValidator:
 
     def _coerce_numeric(self):
         """Coerce all numeric-like columns to numeric dtype (float)."""
-        self._df_num = self.df.copy()
-        all_numeric_cols = self.expected_columns
-        for c in all_numeric_cols:
-            if c in self._df_num.columns:
-                before_na = self._df_num[c].isna().sum()
-                self._df_num[c] = pd.to_numeric(self._df_num[c], errors="coerce")
-                after_na = self._df_num[c].isna().sum()
-                newly_na = max(0, after_na - before_na)
-                if newly_na > 0:
-                    self._add_issue(c, "type_conversion_failed", newly_na)
-
-    def _check_ratio_bounds(self):
-        """Ensure ratio columns are within [0, 1]."""
-        for c in self.ratio_columns:
-            if c in self._df_num.columns:
-                bad = self._df_num[(self._df_num[c] < 0) | (self._df_num[c] > 1)]
-                if not bad.empty:
-                    self._add_issue(c, "ratio_out_of_bounds(0~1)", len(bad))
-                    self._record_failures(bad, c, "ratio_out_of_bounds")
-
-    def _check_nonnegativity(self):
-        """Ensure all numeric columns are non-negative."""
-        for c in self.float_columns + self.int_columns:
-            if c in self._df_num.columns:
-                bad = self._df_num[self._df_num[c] < 0]
-                if not bad.empty:
-                    self._add_issue(c, "negative_value", len(bad))
-                    self._record_failures(bad, c, "negative_value")
-
-    def _check_integer_integrity(self):
-        """Ensure integer columns have no decimal part."""
-        for c in self.int_columns:
-            if c in self._df_num.columns:
-                s = self._df_num[c]
-                mask = s.notna() & ((s % 1) != 0)
-                bad = self._df_num[mask]
-                if not bad.empty:
-                    self._add_issue(c, "integer_required", len(bad))
-                    self._record_failures(bad, c, "non_integer_value")
+        # Shallow copy: columns are replaced, never mutated, so the input frame is untouched
+        self._df_num = self.df.copy(deep=False)
+        needs_coerce = [
+            c for c in self.expected_columns
+            if c in self._df_num.columns and not pd.api.types.is_numeric_dtype(self._df_num[c])
+        ]
+        if not needs_coerce:
+            return
+        raw = self._df_num[needs_coerce]
+        coerced = raw.apply(pd.to_numeric, errors="coerce")
+        newly_na = coerced.isna().sum() - raw.isna().sum()
+        for c in needs_coerce:
+            self._df_num[c] = coerced[c]
+        for c, n in newly_na[newly_na > 0].items():
+            self._add_issue(c, "type_conversion_failed", int(n))
+
+    @staticmethod
+    def _parse_dates(col: pd.Series) -> pd.Series:
+        """
+        Parse one date column (format inferred per column). Offsets are kept as given;
+        a column mixing UTC offsets, which pandas rejects without utc=True, is converted to UTC.
+        """
+        try:
+            return pd.to_datetime(col, errors="coerce", utc=False)
+        except ValueError:
+            return pd.to_datetime(col, errors="coerce", utc=True)
+
+    def _check_dates(self):
+        """Parse each date column on its own, then count conversion failures for all of them at once."""
+        present = [c for c in self.date_columns if c in self._df_num.columns]
+        if not present:
+            return
+        raw = self.df[present]
+        # Separate calls: pandas infers the format from a column's first value, so
+        # stacking columns would force the first column's format onto the others
+        parsed = {c: self._parse_dates(raw[c]) for c in present}
+        newly_na = (np.column_stack([parsed[c].isna().to_numpy() for c in present]).sum(axis=0)
+                    - raw.isna().to_numpy().sum(axis=0))
+        for j, c in enumerate(present):
+            self._df_num[c] = parsed[c]
+            if newly_na[j] > 0:
+                self._add_issue(c, "type_conversion_failed", int(newly_na[j]))
+
+    def _cache_columns(self):
+        """Extract each present numeric column (and the row labels) as ndarrays once, for all later checks."""
+        self._index_arr = self._df_num.index.to_numpy()
+        numeric = dict.fromkeys(self.ratio_columns + self.float_columns + self.int_columns + LOGICAL_COLUMNS)
+        self._cols = {
+            c: self._df_num[c].to_numpy(dtype=np.float64, na_value=np.nan)
+            for c in numeric if c in self._df_num.columns
+        }
+
+    def _check_column_rules(self):
+        """
+        Ratio bounds [0, 1], non-negativity and integer integrity in one pass.
+
+        The ratio, float and int columns are stacked into a single float block
+        (in that order), so each rule works on a contiguous column slice of the
+        same array instead of re-reading its columns from the DataFrame.
+        """
+        ratio = [c for c in self.ratio_columns if c in self._cols]
+        floats = [c for c in self.float_columns if c in self._cols]
+        ints = [c for c in self.int_columns if c in self._cols]
+        cols = ratio + floats + ints
+        if not cols:
+            return
+        arr = np.column_stack([self._cols[c] for c in cols])
+        nr, nf = len(ratio), len(floats)
+        r, nn, it = arr[:, :nr], arr[:, nr:], arr[:, nr + nf:]
+
+        if HAVE_NUMBA and len(arr) >= NUMBA_MIN_ROWS:
+            oob, neg, non_int = _scan_rules(arr, nr, nf)
+        else:
+            frac, _ = np.modf(it)
+            oob, neg, non_int = (r < 0) | (r > 1), nn < 0, np.isfinite(it) & (frac != 0.0)
+
+        self._record_grid(ratio, r, oob, "ratio_out_of_bounds(0~1)", "ratio_out_of_bounds")
+        self._record_grid(floats + ints, nn, neg, "negative_value", "negative_value")
+        self._record_grid(ints, it, non_int, "integer_required", "non_integer_value")
 
     def _check_logical_consistency(self):
         """Check logical relationships between columns."""
-        df = self._df_num
+        col = self._cols.get
+        n = len(self._df_num)
+        mx, mn = col("session_length_max"), col("session_length_mean")
+        daily, weekly = col("total_usage_daily"), col("total_usage_weekly")
+        ratio = [c for c in self.ratio_columns if c in self._cols]
+        has_mm = mx is not None and mn is not None
+        has_dw = daily is not None and weekly is not None
+        R = np.column_stack([self._cols[c] for c in ratio]) if daily is not None and ratio else None
+
+        if HAVE_NUMBA and n >= NUMBA_MIN_ROWS and has_mm and has_dw and R is not None:
+            # Full schema on a large batch: every logical mask from one compiled row pass
+            max_lt, weekly_lt, zero_bad = _scan_logical(mx, mn, daily, weekly, R)
+        else:
+            fused = HAVE_NUMEXPR and n >= NUMEXPR_MIN_ROWS
+            max_lt = mx < mn if has_mm else None  # NaN compares False
+            weekly_lt = None
+            if has_dw:
+                weekly_lt = ne.evaluate("weekly + 1e-9 < daily") if fused else np.less(weekly + 1e-9, daily)
+            zero_bad = None
+            if R is not None:
+                if fused:
+                    # NaN daily counts as zero usage, NaN ratio as zero (same as the NumPy branch)
+                    zero_bad = ne.evaluate("((d == 0) | (d != d)) & (R != 0) & (R == R)",
+                                           local_dict={"d": daily[:, None], "R": R})
+                else:
+                    # Comparisons instead of nan_to_num copies: NaN is neither > 0 nor < 0
+                    zero_usage = ~((daily > 0) | (daily < 0))
+                    zero_bad = zero_usage[:, None] & ((R > 0) | (R < 0))
 
         # (1) session_length_max ≥ session_length_mean
-        if {"session_length_max", "session_length_mean"}.issubset(df.columns):
-            bad = df[
-                df["session_length_max"].notna() &
-                df["session_length_mean"].notna() &
-                (df["session_length_max"] < df["session_length_mean"])
-            ]
-            if not bad.empty:
-                self._add_issue("session_length_max/session_length_mean", "max>=mean", len(bad))
-                self._record_failures(bad, "session_length_max/session_length_mean", "max_less_than_mean")
+        if max_lt is not None:
+            positions = np.flatnonzero(max_lt)
+            if positions.size:
+                self._add_issue("session_length_max/session_length_mean", "max>=mean", len(positions))
+                self._record_failures(positions, "session_length_max/session_length_mean", "max_less_than_mean", mx)
 
         # (2) total_usage_weekly ≥ total_usage_daily (warning only)
-        if {"total_usage_daily", "total_usage_weekly"}.issubset(df.columns):
-            bad_w = df[
-                df["total_usage_daily"].notna() &
-                df["total_usage_weekly"].notna() &
-                (df["total_usage_weekly"] + 1e-9 < df["total_usage_daily"])
-            ]
-            if not bad_w.empty:
-                self._add_issue("total_usage_weekly/daily", "weekly>=daily", len(bad_w), is_warning=True)
+        if weekly_lt is not None:
+            n_bad = int(np.count_nonzero(weekly_lt))
+            if n_bad:
+                self._add_issue("total_usage_weekly/daily", "weekly>=daily", n_bad, is_warning=True)
 
         # (3) If total_usage_daily == 0 → all ratio features must be 0
-        if "total_usage_daily" in df.columns:
-            zero_usage = df[df["total_usage_daily"].fillna(0) == 0]
-            for c in self.ratio_columns:
-                if c in df.columns:
-                    bad_r = zero_usage[zero_usage[c].fillna(0) != 0]
-                    if not bad_r.empty:
-                        self._add_issue(c, "daily_zero => ratio_zero", len(bad_r))
-                        self._record_failures(bad_r, c, "daily_zero_but_ratio_nonzero")
+        if zero_bad is not None:
+            self._record_grid(ratio, R, zero_bad, "daily_zero => ratio_zero", "daily_zero_but_ratio_nonzero")
 
-    # ---------------- Public API ----------------
-    def validate_features(self) -> Tuple[Dict, pd.DataFrame, pd.DataFrame]:
-        """Run full validation and return (report, validated_df, failure_df)."""
+    def _run_checks(self):
+        """Run every check, filling self.report and the failure chunks (no DataFrame/CSV output)."""
         self._check_missing_columns()
         self._coerce_numeric()
-        self._check_ratio_bounds()
-        self._check_nonnegativity()
-        self._check_integer_integrity()
+        self._check_dates()
+        self._cache_columns()
+        self._check_column_rules()
         self._check_logical_consistency()
 
-        failure_df = pd.DataFrame(self.failure_rows)
-        if not failure_df.empty:
-            failure_df.to_csv("feature_validation_failures.csv", index=False)
-
-        self.report["failed_rows_count"] = len(failure_df)
+        self.report["failed_rows_count"] = self._failure_count()
         self.report["summary"] = "fail" if self.report["problems"] > 0 else "pass"
-        return self.report, self._df_num, failure_df
+
+    # ---------------- Public API ----------------
+    def validate_features(self, write_failures: bool = False) -> Tuple[Dict, pd.DataFrame, pd.DataFrame]:
+        """
+        Run full validation and return (report, validated_df, failure_df).
+        Failing rows are written to FAILURE_CSV only when write_failures=True; with problems
+        but no failing rows (e.g. missing columns) the file is header-only, never stale.
+        """
+        self._run_checks()
+        if write_failures and (self._fail_cols["index"] or self.report["problems"] > 0):
+            self._write_failures()
+        return self.report, self._df_num, self._failure_frame()
 
     def quick_validate(self) -> bool:
         """Shortcut: raise error on problems, print warnings otherwise."""
-        report, _, _ = self.validate_features()
+        self._run_checks()
+        report = self.report
         if report["problems"] > 0:
+            self._write_failures()
             raise FeatureValidationError(
                 f"Feature validation failed with {report['problems']} problems. "
-                f"See feature_validation_failures.csv for details."
+                f"See {FAILURE_CSV} for details."
             )
         if report["warnings"] > 0:
             print(f"⚠️ Passed with {report['warnings']} warnings.")
@@ -0,0 +1,22 @@
+"""
+Optional Numba support.
+
+`HAVE_NUMBA` tells callers whether kernels decorated with `njit` are really
+compiled. Without numba installed `njit` is a no-op decorator, so the kernels
+still import but run as plain Python; callers should prefer their NumPy path.
+"""
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
@@ -1,17 +1,259 @@
 import argparse
+import functools
+import glob
+import hashlib
+import importlib
+import math
 import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+import joblib
+import numpy as np
 import pandas as pd
+from sklearn.linear_model import LogisticRegression
 
-from src.machine_learning.feature_validation import DataValidator, FeatureValidationError
-from src.machine_learning.artifacts import load_model_processor, load_threshold
+from src.machine_learning.feature_validation import DataValidator, FeatureValidationError, FEATURES_DAILY_CONFIG
+from src.machine_learning.artifacts import load_model_processor, load_threshold, load_onnx_proba, ONNX_FILE
+from src.machine_learning.calibration import CalibratedWrapper
+from src.machine_learning.jit import njit, prange, HAVE_NUMBA
+from src.machine_learning.quantized_forest import forest_scorer
 
-def predict_dataframe(df: pd.DataFrame, artifacts_dir: str, do_validate: bool=False, validation_config: dict|None=None) -> pd.DataFrame:
+ARTIFACT_FILES = ("model.pkl", "processor.pkl", "threshold.json", ONNX_FILE)
+DEFAULT_BATCH_SIZE = 4096
+DEFAULT_CHUNKSIZE = 50_000
+NUMBA_MIN_ROWS = 100_000
+TRANSFORM_CACHE_BYTES = 512 * 1024 * 1024  # --transform-cache 디스크 캐시 상한 (오래 안 쓴 항목부터 삭제)
+OUTPUT_COLUMNS = ("risk_proba", "risk_flag")
+KEY_COLUMNS = ("user_id", "period_start", "period_end")  # --out-mode narrow 에서 함께 남길 행 식별 컬럼
+
+# 입력 특징 컬럼 dtype 힌트 (실수 float64 — 검증 경계값 유지, 정수 int32)
+INPUT_DTYPES = {
+    **{c: "float64" for c in FEATURES_DAILY_CONFIG["float_columns"] + FEATURES_DAILY_CONFIG["ratio_columns"]},
+    **{c: "int32" for c in FEATURES_DAILY_CONFIG["int_columns"]},
+}
+
+def _artifacts_mtime_key(artifacts_dir: str) -> tuple:
+    """아티팩트 파일들의 mtime (없는 파일은 None) — 재학습으로 파일이 바뀌면 캐시 무효화"""
+    key = []
+    for name in ARTIFACT_FILES:
+        path = os.path.join(artifacts_dir, name)
+        key.append(os.path.getmtime(path) if os.path.exists(path) else None)
+    return tuple(key)
+
+@functools.lru_cache(maxsize=4)
+def _load_cached(artifacts_dir: str, mtime_key: tuple):
+    model, processor = load_model_processor(artifacts_dir)
+    thr = load_threshold(artifacts_dir, default=0.5)
+    return model, processor, thr, resolve_score_fn(model)
+
+def load_predictor(artifacts_dir: str):
+    """(model, processor, threshold, score_fn) — 같은 디렉토리/같은 파일이면 메모리의 객체를 재사용"""
+    artifacts_dir = os.path.abspath(artifacts_dir)
+    return _load_cached(artifacts_dir, _artifacts_mtime_key(artifacts_dir))
+
+def load_artifacts(artifacts_dir: str):
+    """(model, processor, threshold) — load_predictor 와 같은 캐시"""
+    return load_predictor(artifacts_dir)[:3]
+
+@functools.lru_cache(maxsize=4)
+def _load_onnx_cached(artifacts_dir: str, mtime_key: tuple):
+    # model.onnx 는 CalibratedWrapper 의 base 모델 → 보정기는 model.pkl 에서
+    model = _load_cached(artifacts_dir, mtime_key)[0]
+    calibrator = model.calibrator if isinstance(model, CalibratedWrapper) else None
+    return load_onnx_proba(artifacts_dir, calibrator=calibrator)
+
+def load_onnx(artifacts_dir: str):
+    """model.onnx 의 ONNX Runtime 확률 함수 (세션은 디렉토리별로 재사용), 없으면 None"""
+    artifacts_dir = os.path.abspath(artifacts_dir)
+    return _load_onnx_cached(artifacts_dir, _artifacts_mtime_key(artifacts_dir))
+
+@functools.lru_cache(maxsize=8)
+def _load_kernel_cached(artifacts_dir: str, mtime_key: tuple, kind: str):
+    model = _load_cached(artifacts_dir, mtime_key)[0]
+    return forest_scorer(model) if kind == "forest" else linear_scorer(model)
+
+def load_kernel_scorer(artifacts_dir: str, kind: str):
+    """
+    모델 전용 numba 확률 함수 (kind: "forest" = QuantizedForest, "linear" = 선형 모델 GEMV+sigmoid).
+    지원 모델이 아니거나 numba 가 없으면 None
+    """
+    artifacts_dir = os.path.abspath(artifacts_dir)
+    return _load_kernel_cached(artifacts_dir, _artifacts_mtime_key(artifacts_dir), kind)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _sigmoid_kernel(z):
+    for i in prange(z.shape[0]):
+        z[i] = 1.0 / (1.0 + math.exp(-z[i]))
+
+def _sigmoid_inplace(z: np.ndarray) -> np.ndarray:
+    """1/(1+exp(-z)) 를 z 버퍼에 그대로 기록 (임시 배열 없음)"""
+    if HAVE_NUMBA and z.shape[0] >= NUMBA_MIN_ROWS:
+        _sigmoid_kernel(z)
+    else:
+        np.negative(z, out=z)
+        np.exp(z, out=z)
+        z += 1.0
+        np.reciprocal(z, out=z)
+    return z
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _linear_kernel(X, coef, intercept, out):
+    # X·coef + b 와 sigmoid 를 한 패스로 (중간 배열 없음)
+    n_features = coef.shape[0]
+    for i in prange(X.shape[0]):
+        s = intercept
+        for j in range(n_features):
+            s += X[i, j] * coef[j]
+        out[i] = 1.0 / (1.0 + math.exp(-s))
+
+def linear_scorer(model):
+    """
+    이진 선형 모델의 양성 확률 함수 (sigmoid(X·coef + b)), 대상이 아니면 None.
+    대상: LogisticRegression, 또는 predict_proba 없이 decision_function 만 있는 선형 모델
+    (resolve_score_fn 의 sigmoid 경로와 같은 값). 결측 포함 입력은 ValueError → 모델로 예측.
+    """
+    if not HAVE_NUMBA:
+        return None
+    coef = getattr(model, "coef_", None)
+    if coef is None or np.ndim(coef) != 2 or coef.shape[0] != 1:
+        return None
+    if not (isinstance(model, LogisticRegression)
+            or (not hasattr(model, "predict_proba") and hasattr(model, "decision_function"))):
+        return None
+    w = np.ascontiguousarray(coef[0], dtype=np.float64)
+    b = float(np.ravel(getattr(model, "intercept_", [0.0]))[0])
+
+    def predict_proba(X) -> np.ndarray:
+        Xa = np.ascontiguousarray(X.to_numpy(dtype=np.float64) if isinstance(X, pd.DataFrame) else X)
+        if np.isnan(Xa).any():
+            raise ValueError("NaN in linear model input")
+        out = np.empty(Xa.shape[0], dtype=np.float64)
+        _linear_kernel(Xa, w, b, out)
+        return out
+    return predict_proba
+
+def resolve_score_fn(model):
+    """
+    양성 클래스 확률 함수를 모델 로드 시 한 번만 결정
+    (predict_proba → decision_function+sigmoid → predict 순) — 예측 시 hasattr 분기 없음
+    """
+    if hasattr(model, "predict_proba"):
+        predict_proba = model.predict_proba
+        return lambda X: predict_proba(X)[:, 1]
+    if hasattr(model, "decision_function"):
+        decision_function = model.decision_function
+
+        def score(X):
+            z = np.asarray(decision_function(X), dtype=np.float64)
+            return _sigmoid_inplace(z if z.flags.writeable else z.copy())
+        return score
+    predict = model.predict
+    return lambda X: predict(X).astype(float)
+
+def _score_batched(score, X, batch_size: int, n_jobs: int = 1) -> np.ndarray:
+    """
+    batch_size 행 단위로 나눠 score(X) 호출 — 청크 작업 집합을 캐시에 두고 호출 오버헤드는 배치당 1회.
+    n_jobs != 1 이면 배치를 스레드 풀에서 예측 (sklearn 의 C 커널은 GIL 을 풀어줌, 모델 pickling 없음).
+    """
+    n = len(X)
+    if batch_size is None or batch_size <= 0 or n <= batch_size:
+        return np.asarray(score(X))
+    rows = X.iloc if isinstance(X, pd.DataFrame) else X
+    batches = [rows[i:i + batch_size] for i in range(0, n, batch_size)]
+    workers = (os.cpu_count() or 1) if n_jobs is not None and n_jobs < 0 else (n_jobs or 1)
+    if workers > 1 and len(batches) >= 3:  # 배치가 적으면 풀 생성 비용이 더 큼
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as ex:
+            scores = list(ex.map(lambda b: np.asarray(score(b)), batches))
+    else:
+        scores = [np.asarray(score(b)) for b in batches]
+    return np.concatenate(scores)
+
+def _predict_matrix(score, X, batch_size: int, float32: bool, n_jobs: int = 1, onnx_proba=None) -> np.ndarray:
+    """
+    float32=True: 정렬이 끝난 특징을 C-contiguous float32 행렬로 한 번만 변환해 예측.
+    float32 입력을 받지 못하는 모델이면 원래 입력(float64)으로 다시 예측.
+    onnx_proba 가 있으면 (model.onnx) ONNX Runtime 으로 예측 — 입력은 항상 float32.
+    """
+    if onnx_proba is not None:
+        return _score_batched(onnx_proba, np.ascontiguousarray(X, dtype=np.float32), batch_size, n_jobs)
+    if not float32:
+        return _score_batched(score, X, batch_size, n_jobs)
+    Xa = np.ascontiguousarray(X.to_numpy(dtype=np.float32) if isinstance(X, pd.DataFrame) else X, dtype=np.float32)
+    try:
+        with warnings.catch_warnings():
+            # 컬럼 순서는 이미 feature_names_in_ 에 맞춰 정렬됨
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return _score_batched(score, Xa, batch_size, n_jobs)
+    except (TypeError, ValueError):
+        return _score_batched(score, X, batch_size, n_jobs)
+
+def _matrix_feature_index(model, processor):
+    """
+    feature_names_in_ 을 가진 모델의 각 학습 컬럼이 processor.transform_numpy() 행렬의 몇 번째 열인지.
+    행렬로 학습된 모델이거나 학습 컬럼 중 행렬 밖의 것이 있으면 None (DataFrame 경로 사용)
+    """
+    names = getattr(model, "feature_names_in_", None)
+    if names is None or not hasattr(processor, "get_feature_names_out"):
+        return None
+    pos = {c: i for i, c in enumerate(processor.get_feature_names_out())}
+    if any(c not in pos for c in names):
+        return None
+    return np.fromiter((pos[c] for c in names), dtype=np.intp, count=len(names))
+
+def _frame_digest(df: pd.DataFrame) -> str:
+    """행 해시(hash_pandas_object) 전체를 다시 해시 — 행 순서가 바뀌어도 다른 값 (합계와 달리 충돌 없음)"""
+    return hashlib.blake2b(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes(),
+                           digest_size=16).hexdigest()
+
+def _apply_processor(key: tuple, df: pd.DataFrame, processor, as_numpy: bool):
+    return processor.transform_numpy(df) if as_numpy else processor.transform(df)
+
+@functools.lru_cache(maxsize=4)
+def _transform_memory(location: str, mtime_key: tuple):
+    """
+    joblib.Memory 디스크 캐시 (<artifacts>/.cache) — 키는 입력 내용 해시 + 아티팩트 키 (df/processor 자체는 해시하지 않음).
+    아티팩트 mtime 이 기록(artifacts_key)과 다르면 (재학습) 이전 변환 결과를 모두 비움.
+    """
+    memory = joblib.Memory(location, verbose=0)
+    stamp = os.path.join(location, "artifacts_key")
+    try:
+        with open(stamp, encoding="utf-8") as f:
+            recorded = f.read()
+    except OSError:
+        recorded = None
+    if recorded != repr(mtime_key):
+        memory.clear(warn=False)
+        os.makedirs(location, exist_ok=True)
+        with open(stamp, "w", encoding="utf-8") as f:
+            f.write(repr(mtime_key))
+    return memory, memory.cache(_apply_processor, ignore=["df", "processor"])
+
+def _transform(processor, df: pd.DataFrame, as_numpy: bool, artifacts_dir: str, cache: bool):
+    """
+    processor 변환. cache=True 면 <artifacts>/.cache 에 결과를 저장해 같은 입력이면 재사용
+    (TRANSFORM_CACHE_BYTES 를 넘으면 오래된 항목부터 삭제, 아티팩트가 바뀌면 전체 삭제)
+    """
+    if not cache:
+        return _apply_processor(None, df, processor, as_numpy)
+    artifacts_dir = os.path.abspath(artifacts_dir)
+    mtime_key = _artifacts_mtime_key(artifacts_dir)
+    memory, cached = _transform_memory(os.path.join(artifacts_dir, ".cache"), mtime_key)
+    key = (mtime_key, tuple(df.columns), tuple(df.dtypes.astype(str)), _frame_digest(df))
+    out = cached(key, df, processor, as_numpy)
+    memory.reduce_size(bytes_limit=TRANSFORM_CACHE_BYTES)
+    return out
+
+def predict_dataframe(df: pd.DataFrame, artifacts_dir: str, do_validate: bool=False, validation_config: dict|None=None,
+                      batch_size: int = DEFAULT_BATCH_SIZE, float32: bool = True, n_jobs: int = 1,
+                      transform_cache: bool = False, use_onnx: bool = False,
+                      quantized_trees: bool = False) -> pd.DataFrame:
     if df is None or df.empty:
         raise ValueError("입력 데이터가 비어 있습니다.")
 
     # 라벨이 섞여 있으면 제거
     if "depression_label" in df.columns:
-        df = df.drop(columns=["depression_label"])
+        df = df[[c for c in df.columns if c != "depression_label"]]  # 나머지 컬럼 전체 복사 없이 선택
 
     # (옵션) 유효성 검사
     if do_validate:
@@ -24,67 +266,310 @@ def predict_dataframe(df: pd.DataFrame, artifacts_dir: str, do_validate: bool=Fa
         df = df_valid
 
     # 아티팩트 로드
-    model, processor = load_model_processor(artifacts_dir)
-    thr = load_threshold(artifacts_dir, default=0.5)
+    model, processor, thr, score = load_predictor(artifacts_dir)
 
     # 변환
-    X = processor.transform(df)
-
-    # 숫자형만 사용 + 학습 시 컬럼 순서로 정렬
-    import numpy as _np
-    X = X.select_dtypes(include=[_np.number]).copy()
-    if hasattr(model, "feature_names_in_"):
-        missing = [c for c in model.feature_names_in_ if c not in X.columns]
+    feature_idx = _matrix_feature_index(model, processor) if float32 else None
+    if feature_idx is not None:
+        # DataFrame 으로 학습됐지만 학습 컬럼이 전부 processor 행렬 안에 있음:
+        # float32 행렬에서 열만 골라 바로 사용 (DataFrame 생성/선택 없음)
+        X = np.ascontiguousarray(_transform(processor, df, True, artifacts_dir, transform_cache)[:, feature_idx])
+        onnx_proba = None
+    elif hasattr(model, "feature_names_in_"):
+        # DataFrame 으로 학습된 모델: 학습 시 컬럼만 그 순서로 한 번에 선택 (숫자형인지만 확인)
+        X = _transform(processor, df, False, artifacts_dir, transform_cache)
+        cols = list(model.feature_names_in_)
+        present = set(X.columns)
+        missing = [c for c in cols if c not in present]
         if missing:
             raise ValueError(f"예측 입력에 학습 시 컬럼이 없습니다: {missing}")
-        X = X.loc[:, model.feature_names_in_]
+        X = X[cols]
+        non_numeric = [c for c, is_num in X.dtypes.apply(pd.api.types.is_numeric_dtype).items() if not is_num]
+        if non_numeric:
+            raise ValueError(f"예측 입력의 학습 시 컬럼이 숫자형이 아닙니다: {non_numeric}")
+        onnx_proba = None
+    else:
+        # 행렬로 학습된 모델: 컬럼 순서는 processor 가 보관 (get_feature_names_out)
+        X = _transform(processor, df, True, artifacts_dir, transform_cache)
+        # (옵션) 학습 시 model.onnx 가 함께 저장됐으면 ONNX Runtime 사용 (같은 행렬 입력)
+        onnx_proba = load_onnx(artifacts_dir) if use_onnx else None
 
     # 예측
-    if hasattr(model, "predict_proba"):
-        proba = model.predict_proba(X)[:, 1]
-    elif hasattr(model, "decision_function"):
-        proba = 1/(1+_np.exp(-model.decision_function(X)))
-    else:
-        proba = model.predict(X).astype(float)
-    flag = (proba >= thr).astype(int)
+    proba, kernel = None, None
+    if quantized_trees:
+        # (옵션) RF/ExtraTrees: 분기 임계값 순위 코드(uint8/16)로 numba 순회 — predict_proba 와 동일 결과
+        kernel = load_kernel_scorer(artifacts_dir, "forest")
+    if kernel is None and onnx_proba is None:
+        # 선형 모델이면 GEMV + sigmoid 융합 커널
+        kernel = load_kernel_scorer(artifacts_dir, "linear")
+    if kernel is not None:
+        try:
+            proba = kernel(X)
+        except ValueError:  # 결측 포함 입력 → 모델로 예측
+            proba = None
+    if proba is None:
+        proba = _predict_matrix(score, X, batch_size, float32, n_jobs, onnx_proba)
+    flag = np.empty(proba.shape, dtype=np.int8)  # bool 임시 배열 + int64 캐스팅 없이 1바이트/행
+    np.greater_equal(proba, thr, out=flag.view(bool))
 
-    out = df.copy()
-    out["risk_proba"] = proba
-    out["risk_flag"]  = flag
-    return out
+    # 입력 컬럼은 복사 없이 공유 (assign 은 얕은 복사), 새 두 컬럼만 할당
+    return df.assign(risk_proba=proba, risk_flag=flag)
+
+# CSV 읽기 백엔드 (옵션): CP_DF_BACKEND=fireducks → pandas 호환 API 의 fireducks.pandas
+# 읽은 프레임은 바로 pandas 로 변환 — 검증기/processor/변환 캐시는 모두 pandas 기준
+DF_BACKENDS = {"pandas": "pandas", "fireducks": "fireducks.pandas"}
+
+@functools.lru_cache(maxsize=None)
+def _df_backend(name: str):
+    """CSV 읽기용 DataFrame 모듈. 모르는 이름이거나 미설치면 경고 후 pandas"""
+    if name not in DF_BACKENDS:
+        print(f"⚠️ CP_DF_BACKEND={name}: {sorted(DF_BACKENDS)} 중 하나가 아님, pandas 사용")
+        return pd
+    try:
+        return importlib.import_module(DF_BACKENDS[name])
+    except ImportError:
+        print(f"⚠️ CP_DF_BACKEND={name}: {DF_BACKENDS[name]} 미설치, pandas 사용")
+        return pd
+
+def _as_pandas(df) -> pd.DataFrame:
+    return df if isinstance(df, pd.DataFrame) else df.to_pandas()
+
+def _read_csv(path: str, **kwargs):
+    """CP_DF_BACKEND 로 read_csv — pandas DataFrame (chunksize 가 있으면 pandas 청크 iterator)"""
+    backend = _df_backend(os.environ.get("CP_DF_BACKEND", "pandas"))
+    if backend is pd:
+        return pd.read_csv(path, **kwargs)
+    out = backend.read_csv(path, **kwargs)
+    return (_as_pandas(c) for c in out) if kwargs.get("chunksize") else _as_pandas(out)
+
+def read_input(path: str) -> pd.DataFrame:
+    """입력 로드: .parquet 는 그대로, CSV 는 pyarrow 멀티스레드 파서 (미설치 시 pandas)"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if _df_backend(os.environ.get("CP_DF_BACKEND", "pandas")) is not pd:
+        return _read_csv(path)
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return pd.read_csv(path)
+    # 타임스탬프로 추론되는 컬럼은 문자열 그대로 둠 (pandas.read_csv 처럼 원본 표기/오프셋 보존)
+    # — 스키마는 첫 블록만 읽어 추론
+    reader = pacsv.open_csv(path)
+    keep = {f.name: pa.string() for f in reader.schema if pa.types.is_timestamp(f.type)}
+    reader.close()
+    # 특징 컬럼은 dtype 을 지정해 타입 추론 생략 + 정수는 int32 (없는 컬럼은 무시됨)
+    hints = {c: pa.from_numpy_dtype(np.dtype(t)) for c, t in INPUT_DTYPES.items()}
+    try:
+        opts = pacsv.ConvertOptions(column_types={**hints, **keep}, strings_can_be_null=True)
+        return pacsv.read_csv(path, convert_options=opts).to_pandas()
+    except pa.ArrowInvalid:
+        # 변환 불가 값(소수인 정수 컬럼, 문자 등) → 추론으로 읽고 검증기가 잡아내게 둠
+        opts = pacsv.ConvertOptions(column_types=keep, strings_can_be_null=True)
+        return pacsv.read_csv(path, convert_options=opts).to_pandas()
+
+def iter_input(path: str, chunksize: int):
+    """chunksize 행 단위 DataFrame 스트림 (0 이하면 read_input 으로 전체를 한 번에). 인덱스는 파일 행 번호로 이어짐"""
+    if not chunksize or chunksize <= 0:
+        yield read_input(path)
+        return
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        start = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+        return
+    # round_trip: pyarrow 파서(read_input)와 같은 값으로 실수 파싱
+    # 실수/비율 컬럼은 float64 힌트로 타입 추론 생략 (정수 힌트는 결측이 있으면 실패하므로 제외)
+    hints = {c: t for c, t in INPUT_DTYPES.items() if t == "float64"}
+    start = 0
+    try:
+        for chunk in _read_csv(path, chunksize=chunksize, float_precision="round_trip", dtype=hints):
+            start += len(chunk)
+            yield chunk
+        return
+    except ValueError:
+        pass  # 실수 컬럼에 숫자가 아닌 값 → 남은 행은 추론으로 읽고 검증기가 잡아내게 둠
+    for chunk in _read_csv(path, chunksize=chunksize, float_precision="round_trip",
+                           skiprows=range(1, start + 1)):
+        chunk.index = chunk.index + start
+        yield chunk
+
+def _csv_table(res: pd.DataFrame):
+    """
+    CSV 용 Arrow 테이블. 실수 컬럼은 pandas.to_csv 와 같은 문자열로 미리 포맷
+    (numpy repr: 54.0, 1e-05 — Arrow 는 54, 0.00001 로 씀), 결측은 빈 칸.
+    """
+    import pyarrow as pa
+    arrays = []
+    for name in res.columns:
+        col = res[name]
+        if pd.api.types.is_float_dtype(col.dtype):
+            v = col.to_numpy(na_value=np.nan)
+            arrays.append(pa.array(v.astype(str), type=pa.string(), mask=np.isnan(v)))
+        else:
+            arrays.append(pa.Array.from_pandas(col))
+    return pa.table(arrays, names=[str(c) for c in res.columns])
+
+def write_output(res: pd.DataFrame, path: str, fmt: str|None=None, append: bool=False):
+    """
+    결과 저장: parquet 또는 CSV (pyarrow CSV writer, 따옴표가 필요한 값이 있으면 pandas).
+    append=True 면 CSV 에 헤더 없이 이어 씀 (parquet 은 predict_file 의 ParquetWriter 사용).
+    """
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "csv")
+    if fmt == "parquet":
+        res.to_parquet(path, index=False)
+        return
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        pa = None
+    if pa is not None:
+        try:
+            table = _csv_table(res)
+            # pandas.to_csv 와 같은 비인용 출력; 인용이 필요한 값은 ArrowInvalid → pandas
+            # (메모리 버퍼에 먼저 써서 실패 시 파일에 반쯤 쓴 청크가 남지 않게 함)
+            buf = pa.BufferOutputStream()
+            pacsv.write_csv(table, buf, write_options=pacsv.WriteOptions(include_header=False, quoting_style="none"))
+            with open(path, "ab" if append else "wb") as f:
+                if not append:
+                    f.write((",".join(map(str, res.columns)) + "\n").encode("utf-8"))
+                f.write(buf.getvalue().to_pybytes())
+            return
+        except (pa.ArrowException, TypeError) as e:
+            print(f"⚠️ Arrow CSV write failed ({e}); falling back to pandas")
+    res.to_csv(path, index=False, mode="a" if append else "w", header=not append)
+
+def _promote_int_columns(res: pd.DataFrame) -> pd.DataFrame:
+    """
+    청크 출력용: 예측 컬럼 외 정수 컬럼은 float64 로 올림 — 첫 청크에서 정수로 추론된 컬럼이
+    뒤 청크에서 55.5 나 결측을 가져도 같은 Parquet 스키마 / 같은 CSV 표기(41.0)를 유지.
+    """
+    ints = {c: "float64" for c in res.columns
+            if c not in OUTPUT_COLUMNS and pd.api.types.is_integer_dtype(res[c].dtype)}
+    return res.astype(ints) if ints else res
+
+def narrow_output(res: pd.DataFrame) -> pd.DataFrame:
+    """행 식별 컬럼(KEY_COLUMNS 중 있는 것) + risk_proba/risk_flag 만 남긴 결과"""
+    present = set(res.columns)
+    return res[[c for c in KEY_COLUMNS if c in present] + list(OUTPUT_COLUMNS)]
+
+def predict_file(in_path: str, artifacts_dir: str, out_path: str, fmt: str|None=None,
+                 chunksize: int = DEFAULT_CHUNKSIZE, out_mode: str = "full", **predict_kwargs) -> int:
+    """
+    입력 파일을 chunksize 행씩 읽어 예측하고 바로 출력에 이어 씀 — 피크 메모리는 청크 크기에 비례.
+    out_mode="narrow" 면 입력 특징 컬럼은 다시 쓰지 않고 식별 컬럼 + 예측 두 컬럼만 저장.
+    아티팩트는 load_artifacts 캐시로 한 번만 로드. 반환값은 처리한 행 수.
+    """
+    fmt = fmt or ("parquet" if out_path.endswith(".parquet") else "csv")
+    load_artifacts(artifacts_dir)  # 첫 청크를 읽기 전에 아티팩트 오류를 드러냄
+    # 임시 파일에 쓰고 전부 성공했을 때만 out_path 로 교체 — 뒤 청크에서 검증/예측이
+    # 실패해도 앞 청크만 담긴 (정상처럼 보이는) 출력이 남지 않음
+    tmp_path = out_path + ".part"
+    n_rows, pq_writer = 0, None
+    try:
+        for chunk in iter_input(in_path, chunksize):
+            res = predict_dataframe(chunk, artifacts_dir, **predict_kwargs)
+            if out_mode == "narrow":
+                res = narrow_output(res)
+            res = _promote_int_columns(res)
+            if fmt == "parquet":
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(res, preserve_index=False)
+                if pq_writer is None:
+                    pq_writer = pq.ParquetWriter(tmp_path, table.schema)
+                # 전부 결측인 청크 등 남은 추론 차이는 첫 청크 스키마로 cast
+                pq_writer.write_table(table.cast(pq_writer.schema))
+            else:
+                write_output(res, tmp_path, "csv", append=n_rows > 0)
+            n_rows += len(res)
+        if pq_writer is not None:
+            pq_writer.close()
+            pq_writer = None
+        if n_rows == 0:
+            raise ValueError("입력 데이터가 비어 있습니다.")
+        os.replace(tmp_path, out_path)
+    finally:
+        if pq_writer is not None:
+            pq_writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return n_rows
+
+def _predict_one_file(job: tuple):
+    """Pool 작업 단위: (입력, 출력, artifacts, fmt, chunksize, out_mode, predict 옵션) → (입력, 행 수)"""
+    in_path, out_path, artifacts_dir, fmt, chunksize, out_mode, predict_kwargs = job
+    return in_path, predict_file(in_path, artifacts_dir, out_path, fmt=fmt, chunksize=chunksize,
+                                 out_mode=out_mode, **predict_kwargs)
+
+def predict_files(in_paths: list, artifacts_dir: str, out_dir: str, fmt: str|None=None,
+                  chunksize: int = DEFAULT_CHUNKSIZE, processes: int|None=None, out_mode: str = "full",
+                  **predict_kwargs) -> list:
+    """
+    여러 입력 파일을 프로세스 병렬로 예측 — 파일마다 <out_dir>/<이름>_pred.csv (또는 .parquet).
+    각 워커는 아티팩트를 한 번만 로드 (load_predictor 캐시). 반환값은 [(입력 경로, 행 수)].
+    """
+    ext = ".parquet" if fmt == "parquet" else ".csv"
+    outs = [os.path.join(out_dir, os.path.splitext(os.path.basename(p))[0] + "_pred" + ext) for p in in_paths]
+    if len(set(outs)) != len(outs):
+        raise ValueError("입력 파일 이름이 겹쳐 출력 경로가 충돌합니다 (서로 다른 디렉토리의 같은 파일명)")
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(p, o, artifacts_dir, fmt, chunksize, out_mode, predict_kwargs) for p, o in zip(in_paths, outs)]
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    if processes <= 1:
+        return [_predict_one_file(job) for job in jobs]
+    with Pool(processes) as pool:
+        return pool.map(_predict_one_file, jobs)
 
 def main():
     ap = argparse.ArgumentParser(description="Predict using saved artifacts (model, processor, threshold)")
-    ap.add_argument("--in", dest="in_path", required=True, help="입력 CSV 경로 (특징만)")
+    inputs = ap.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--in", dest="in_path", help="입력 CSV 경로 (특징만)")
+    inputs.add_argument("--in-glob", help="여러 입력 파일 glob (프로세스 병렬, --out 은 출력 디렉토리)")
     ap.add_argument("--artifacts", required=True, help="artifacts 디렉토리 (model.pkl, processor.pkl, threshold.json)")
-    ap.add_argument("--out", required=True, help="출력 CSV 경로")
+    ap.add_argument("--out", required=True, help="출력 경로 (CSV 또는 .parquet), --in-glob 이면 출력 디렉토리")
+    ap.add_argument("--format", choices=["csv", "parquet"], default=None, help="출력 형식 (기본: --out 확장자로 판단)")
+    ap.add_argument("--out-mode", choices=["full", "narrow"], default="full",
+                    help="full: 입력 컬럼 + 예측, narrow: 식별 컬럼(user_id, period_*) + risk_proba/risk_flag 만")
     ap.add_argument("--validate", action="store_true", help="실행 시 feature validation 수행(옵션)")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="예측 배치 크기 (행 수, 0 이하면 한 번에)")
+    ap.add_argument("--n-jobs", type=int, default=1, help="배치 예측 스레드 수 (-1: 전체 코어)")
+    ap.add_argument("--procs", type=int, default=None, help="--in-glob 워커 프로세스 수 (기본: 코어 수)")
+    ap.add_argument("--transform-cache", action="store_true",
+                    help="processor 변환 결과를 <artifacts>/.cache 에 캐시 (같은 입력 재예측 시, 최대 512MB, 아티팩트가 바뀌면 비움)")
+    ap.add_argument("--onnx", action="store_true", help="model.onnx 가 있으면 ONNX Runtime 으로 예측 (없으면 sklearn 모델)")
+    ap.add_argument("--quantized-trees", action="store_true", help="RandomForest/ExtraTrees 모델을 순위 코드 numba 커널로 예측")
+    ap.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="한 번에 읽어 예측할 행 수 (0 이하면 파일 전체)")
     args = ap.parse_args()
 
-    # 👉 10개 스키마
-    VALIDATION_CONFIG = {
-        "expected_columns": [
-            "total_usage_daily","total_usage_weekly",
-            "late_night_ratio","sns_ent_ratio",
-            "session_length_max","session_length_mean",
-            "bounce_ratio","avg_tab_cnt","search_freq","repeat_site_ratio"
-        ],
-        "ratio_columns": ["late_night_ratio","sns_ent_ratio","bounce_ratio","repeat_site_ratio"],
-        "float_columns": ["total_usage_daily","total_usage_weekly","session_length_max","session_length_mean"],
-        "int_columns": ["avg_tab_cnt","search_freq"],
-        "date_columns": []
-    }
-
-    df = pd.read_csv(args.in_path)
-    res = predict_dataframe(
-        df=df,
-        artifacts_dir=args.artifacts,
+    predict_kwargs = dict(
         do_validate=args.validate,
-        validation_config=VALIDATION_CONFIG if args.validate else None,
+        validation_config=FEATURES_DAILY_CONFIG if args.validate else None,
+        batch_size=args.batch_size,
+        n_jobs=args.n_jobs,
+        transform_cache=args.transform_cache,
+        use_onnx=args.onnx,
+        quantized_trees=args.quantized_trees,
     )
+    if args.in_glob:
+        in_paths = sorted(glob.glob(args.in_glob))
+        if not in_paths:
+            raise FileNotFoundError(f"--in-glob 에 맞는 파일이 없습니다: {args.in_glob}")
+        results = predict_files(in_paths, args.artifacts, args.out, fmt=args.format,
+                                chunksize=args.chunksize, processes=args.procs, out_mode=args.out_mode,
+                                **predict_kwargs)
+        print(f"[OK] wrote {len(results)} files to {args.out} (rows={sum(n for _, n in results)})")
+        return
+
     os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    res.to_csv(args.out, index=False)
-    print(f"[OK] wrote {args.out} (rows={len(res)})")
+    n_rows = predict_file(args.in_path, args.artifacts, args.out, fmt=args.format,
+                          chunksize=args.chunksize, out_mode=args.out_mode, **predict_kwargs)
+    print(f"[OK] wrote {args.out} (rows={n_rows})")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+"""
+Compact-code inference for fitted scikit-learn forests.
+
+Every split of a tree ensemble compares one feature against one of a finite set
+of thresholds. Replacing each feature value by its rank among that feature's
+split thresholds (uint8 when a feature has at most 255 distinct thresholds,
+uint16 otherwise) keeps every `x <= threshold` decision identical, so
+predictions match `predict_proba` exactly while the traversal reads one or two
+bytes per comparison instead of a float32.
+"""
+
+import os
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+from src.machine_learning.calibration import CalibratedWrapper
+from src.machine_learning.jit import njit, prange, HAVE_NUMBA
+
+TREE_LEAF = -1
+
+
+@njit(cache=True)
+def _forest_rows(codes, roots, nodes, leaf, out, lo, hi):
+    # Tree-outer / row-inner: one tree's nodes stay in cache while the rows stream past
+    n_trees = roots.shape[0]
+    for i in range(lo, hi):
+        out[i] = 0.0
+    for t in range(n_trees):
+        root = roots[t]
+        for i in range(lo, hi):
+            node = root
+            while True:
+                child = nodes[node, 0]
+                if child == TREE_LEAF:
+                    break
+                node = child if codes[i, nodes[node, 2]] <= nodes[node, 3] else nodes[node, 1]
+            out[i] += leaf[node]
+    for i in range(lo, hi):
+        out[i] /= n_trees
+
+
+@njit(parallel=True, cache=True)
+def _forest_kernel(codes, roots, nodes, leaf, out, n_blocks):
+    n = codes.shape[0]
+    block = (n + n_blocks - 1) // n_blocks
+    for b in prange(n_blocks):
+        _forest_rows(codes, roots, nodes, leaf, out, min(n, b * block), min(n, (b + 1) * block))
+
+
+class QuantizedForest:
+    """A binary RandomForest/ExtraTrees classifier flattened into rank-coded node arrays."""
+
+    def __init__(self, edges, roots, nodes, leaf, code_dtype):
+        self.edges = edges            # per-feature sorted split thresholds
+        self.roots = roots            # root node index of each tree
+        self.nodes = nodes            # int32 (n_nodes, 4): left, right, feature, threshold rank
+        self.leaf = leaf              # positive-class fraction at each node
+        self.code_dtype = code_dtype
+
+    @classmethod
+    def from_model(cls, model):
+        """Build from a fitted forest; None if the model type or shape is not supported."""
+        if not isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            return None
+        if getattr(model, "n_outputs_", 1) != 1 or len(model.classes_) != 2:
+            return None
+        trees = [est.tree_ for est in model.estimators_]
+        n_features = model.n_features_in_
+
+        # Sorted distinct split thresholds per feature
+        edges = []
+        for f in range(n_features):
+            parts = [t.threshold[(t.children_left != TREE_LEAF) & (t.feature == f)] for t in trees]
+            edges.append(np.unique(np.concatenate(parts)) if parts else np.empty(0))
+        n_edges = max((len(e) for e in edges), default=0)
+        if n_edges > np.iinfo(np.uint16).max - 1:
+            return None
+        code_dtype = np.uint8 if n_edges <= np.iinfo(np.uint8).max else np.uint16
+
+        roots, nodes, leaf = [], [], []
+        offset = 0
+        for t in trees:
+            is_split = t.children_left != TREE_LEAF
+            feat = np.where(is_split, t.feature, 0)
+            # x <= threshold  ⇔  rank(x) <= rank(threshold), rank = searchsorted(edges, ·, "left")
+            rank = np.zeros(t.node_count, dtype=np.int64)
+            for f in np.unique(feat[is_split]):
+                sel = is_split & (feat == f)
+                rank[sel] = np.searchsorted(edges[f], t.threshold[sel], side="left")
+            nodes.append(np.column_stack([
+                np.where(is_split, t.children_left + offset, TREE_LEAF),
+                np.where(is_split, t.children_right + offset, TREE_LEAF),
+                feat, rank]))
+            counts = t.value[:, 0, :]
+            leaf.append(counts[:, 1] / counts.sum(axis=1))
+            roots.append(offset)
+            offset += t.node_count
+
+        return cls(edges,
+                   np.asarray(roots, dtype=np.int32),
+                   np.ascontiguousarray(np.concatenate(nodes), dtype=np.int32),
+                   np.concatenate(leaf).astype(np.float64),
+                   code_dtype)
+
+    def encode(self, X) -> np.ndarray:
+        """Rank-code X against the split thresholds (float32 first, as sklearn trees do)."""
+        X32 = np.asarray(X, dtype=np.float32)
+        if np.isnan(X32).any():
+            raise ValueError("QuantizedForest does not route missing values; use the model itself")
+        codes = np.empty(X32.shape, dtype=self.code_dtype)
+        for f, e in enumerate(self.edges):
+            codes[:, f] = np.searchsorted(e, X32[:, f].astype(np.float64), side="left")
+        return codes
+
+    def predict_proba_pos(self, X) -> np.ndarray:
+        """Positive-class probability, equal to the forest's predict_proba(X)[:, 1]."""
+        codes = self.encode(X)
+        out = np.empty(codes.shape[0], dtype=np.float64)
+        n_blocks = max(1, min(os.cpu_count() or 1, codes.shape[0]))
+        _forest_kernel(codes, self.roots, self.nodes, self.leaf, out, n_blocks)
+        return out
+
+
+def forest_scorer(model):
+    """
+    Positive-class probability function using a QuantizedForest, or None when numba
+    is missing or the model (or the base of a CalibratedWrapper) is not a supported forest.
+    The returned function raises ValueError on inputs containing NaN.
+    """
+    if not HAVE_NUMBA:
+        return None
+    calibrator = None
+    if isinstance(model, CalibratedWrapper):
+        model, calibrator = model.base, model.calibrator
+    qf = QuantizedForest.from_model(model)
+    if qf is None:
+        return None
+    if calibrator is None:
+        return qf.predict_proba_pos
+    return lambda X: calibrator.predict(qf.predict_proba_pos(X))